@@ -0,0 +1,81 @@
+#Arrival processes of the cars leaving a parking lot.
+#offset(lot, n, last, random) is the release time of the lot's n-th car (from
+#0) counted from the lot's minTravelTime. last is the offset the process gave
+#the car before it, None for the first, and random the run's parking stream.
+#A lot asks for the next car only when the one before has driven off, see
+#Objects.handleRelease, so a process keeps nothing per car. A car due before
+#then leaves one time unit after it, as cars queued in a lot always did.
+#earliest(lot, n) is the smallest offset the process can give car n, used by
+#the quickest flow bound (quickestflow.py); a process without it counts as 0.
+#Processes are plain classes so a world using one can be pickled; pick one with
+#PARKING_RELEASE, or set that parameter to an instance of your own.
+
+#The schedule the simulator always had: car n gets the n-th slot, headway
+#apart, plus a delay of 1 + Exp(1)
+class Scheduled:
+    def __init__(self, headway=1.0):
+        assert(headway > 0)
+        self.headway = headway
+    def offset(self, lot, n, last, random):
+        return n * self.headway + random.exponential(1)
+    def earliest(self, lot, n):
+        return n * self.headway + 1
+    def __repr__(self):
+        return "Scheduled(" + repr(self.headway) + ")"
+
+#A car every headway, the first at the lot's minTravelTime
+class Deterministic:
+    def __init__(self, headway=1.0):
+        assert(headway > 0)
+        self.headway = headway
+    def offset(self, lot, n, last, random):
+        return n * self.headway
+    def earliest(self, lot, n):
+        return n * self.headway
+    def __repr__(self):
+        return "Deterministic(" + repr(self.headway) + ")"
+
+#Cars leave as a Poisson process of rate cars per time unit
+class Poisson:
+    def __init__(self, rate=1.0):
+        assert(rate > 0)
+        self.rate = rate
+    def offset(self, lot, n, last, random):
+        return (0 if last is None else last) + random.exponential(0) / self.rate
+    def earliest(self, lot, n):
+        return 0
+    def __repr__(self):
+        return "Poisson(" + repr(self.rate) + ")"
+
+#Waves of departures. stages is a list of (start, fraction): from start on,
+#fraction of every lot's cars leave following process, the last stage taking
+#whatever is left. E.g. Staged([(0, 0.5), (600, 0.5)]) sends half the cars ten
+#minutes after the first half started.
+class Staged:
+    def __init__(self, stages, process=None):
+        assert(len(stages) > 0)
+        assert(all(a[0] <= b[0] for (a, b) in zip(stages, stages[1:])))
+        assert(sum(fraction for (start, fraction) in stages) <= 1 + 1e-9)
+        self.stages = [(start, fraction) for (start, fraction) in stages]
+        self.process = process if process is not None else Scheduled()
+    #(start, first car) of the stage car n of lot is in
+    def __stage(self, lot, n):
+        first = 0
+        for (ndx, (start, fraction)) in enumerate(self.stages):
+            if(ndx == len(self.stages) - 1):
+                count = lot.capacity - first
+            else:
+                count = min(int(round(fraction * lot.capacity)), lot.capacity - first)
+            if(n < first + count):
+                return (start, first)
+            first += count
+        raise Exception('Lot ' + str(lot.id) + ' has no car ' + str(n))
+    def offset(self, lot, n, last, random):
+        (start, first) = self.__stage(lot, n)
+        previous = last - start if(last is not None and n > first) else None
+        return start + self.process.offset(lot, n - first, previous, random)
+    def earliest(self, lot, n):
+        (start, first) = self.__stage(lot, n)
+        return start + getattr(self.process, 'earliest', lambda lot, n: 0)(lot, n - first)
+    def __repr__(self):
+        return "Staged(" + repr(self.stages) + ", " + repr(self.process) + ")"
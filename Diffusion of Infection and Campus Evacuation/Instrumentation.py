@@ -0,0 +1,60 @@
+import json
+import time as t
+import numpy as np
+
+#Event loop instrumentation, on when INSTRUMENT is set.
+#The loop hands every event to handle(), which counts it by type, times its
+#handler and samples the length of the event list every sampleInterval events.
+#The handlers report blocking per node: cars queued behind another car, head
+#cars backed up because every way on is full, and retries at an intersection
+#whose chosen turn was full while another was open. When it is off the loop
+#only pays for one test per event. report() gathers everything into a
+#dictionary that save() writes as JSON.
+class Instrumentation:
+    TYPE_NAMES = ['IN_PARKING', 'ON_STREET', 'AT_INTERSECTION', 'EXIT', 'ARRIVAL', 'MESSAGE', 'RELEASE']
+    def __init__(self, nodeCount, sampleInterval=1000):
+        assert(sampleInterval > 0)
+        self.sampleInterval = sampleInterval
+        self.counts = [0] * len(Instrumentation.TYPE_NAMES)
+        self.handlerTime = [0.0] * len(Instrumentation.TYPE_NAMES)
+        self.handled = 0
+        self.wall = 0.0
+        self.queueEvents = []
+        self.queueTimes = []
+        self.queueSizes = []
+        self.queued = np.zeros(nodeCount, dtype=np.int64)
+        self.backedUp = np.zeros(nodeCount, dtype=np.int64)
+        self.retries = np.zeros(nodeCount, dtype=np.int64)
+    def handle(self, world, event, time, pending):
+        type = event.type
+        start = t.perf_counter()
+        event.eventHandler(world, event, time)
+        self.handlerTime[type] += t.perf_counter() - start
+        self.counts[type] += 1
+        if(self.handled % self.sampleInterval == 0):
+            self.queueEvents.append(self.handled)
+            self.queueTimes.append(time)
+            self.queueSizes.append(pending)
+        self.handled += 1
+    def report(self, world, blocking=None):
+        types = {}
+        for (type, name) in enumerate(Instrumentation.TYPE_NAMES):
+            count = self.counts[type]
+            types[name] = {'count': count, 'seconds': self.handlerTime[type], \
+                'meanMicroseconds': 1e6 * self.handlerTime[type] / count if count > 0 else 0}
+        nodes = []
+        for node in world.nodes:
+            ndx = node.index
+            if(self.queued[ndx] > 0 or self.backedUp[ndx] > 0 or self.retries[ndx] > 0):
+                nodes.append({'id': node.id, 'comment': node.comment, 'queued': int(self.queued[ndx]), \
+                    'backedUp': int(self.backedUp[ndx]), 'retries': int(self.retries[ndx])})
+        nodes.sort(key=lambda record: -(record['backedUp'] + record['retries']))
+        return {'events': self.handled, 'wall': self.wall, \
+            'eventsPerSecond': self.handled / self.wall if self.wall > 0 else 0, \
+            'handlerSeconds': sum(self.handlerTime), 'types': types, \
+            'queue': {'events': self.queueEvents, 'times': self.queueTimes, 'sizes': self.queueSizes}, \
+            'nodes': nodes, 'blocking': dict(blocking or {})}
+    def save(self, fileName, world, blocking=None):
+        with open(fileName, 'w') as f:
+            json.dump(self.report(world, blocking), f, indent=1)
+        return fileName
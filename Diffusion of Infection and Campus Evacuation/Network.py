@@ -0,0 +1,53 @@
+import numpy as np
+from Objects import Node
+
+#Compiled, read-only view of the road network built once at the end of
+#buildGraph. Node i of the network is nodes[i]; its street children are
+#childIndex[childStart[i]:childStart[i+1]] (parking lots are never entered from
+#the road so they are left out). exitChild holds the position of the first exit
+#among a node's children or -1, and the children facing east are listed the same
+#way in eastStart/eastChild, as positions within the node's children.
+#Compiling also hands every node its own slice as tuples so the event handlers
+#read them without touching numpy or redoing any geometry.
+class Network:
+    def __init__(self, nodes):
+        self.nodes = list(nodes)
+        n = len(self.nodes)
+        exitChild = []
+        eastStart = [0]
+        eastChild = []
+        for (ndx, node) in enumerate(self.nodes):
+            children = [child for child in node.getAllChildren() if child.type == Node.TYPE_STREET]
+            exitNdx = -1
+            east = []
+            for (i, child) in enumerate(children):
+                if(child.exit and exitNdx == -1):
+                    exitNdx = i
+                if(child.isTowardEast()):
+                    east.append(i)
+            node.compile(ndx, children, exitNdx, east)
+            exitChild.append(exitNdx)
+            eastChild.extend(east)
+            eastStart.append(len(eastChild))
+        childStart = [0]
+        childIndex = []
+        for node in self.nodes:
+            childIndex.extend(child.index for child in node.children)
+            childStart.append(len(childIndex))
+        self.size = n
+        self.childStart = np.array(childStart, dtype=np.int32)
+        self.childIndex = np.array(childIndex, dtype=np.int32)
+        self.exitChild = np.array(exitChild, dtype=np.int32)
+        self.eastStart = np.array(eastStart, dtype=np.int32)
+        self.eastChild = np.array(eastChild, dtype=np.int32)
+        self.direction = np.array([node.direction for node in self.nodes], dtype=np.float64)
+        self.minTravelTime = np.array([node.minTravelTime for node in self.nodes], dtype=np.float64)
+        self.capacity = np.array([node.capacity for node in self.nodes], dtype=np.int64)
+        self.isExit = np.array([node.exit for node in self.nodes], dtype=bool)
+        self.isParking = np.array([node.type == Node.TYPE_PARKING for node in self.nodes], dtype=bool)
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for node in self.nodes:
+            node.relink(self.nodes)
+    def children(self, ndx):
+        return self.childIndex[self.childStart[ndx]:self.childStart[ndx + 1]]
@@ -1,9 +1,10 @@
 import types
 import numpy as np
+import parameters
 from parameters import *
 from random import random, seed, gauss
 from math import log
-from heapq import heappush, heappop, heapify
+from collections import deque
 
 def getDirection(node):
     (x1,y1) = node.start
@@ -49,9 +50,24 @@ def genID(N=5):
 #   id: assigned id for easy identification
 #   exit: whether this node is a designated evacuation location 
 #Each node is connected to the nodes that have start as this node's start.
+#Cars are kept in a FIFO deque. Every car entering gets the node's next entry
+#sequence number, so a car's rank in the queue is its sequence number minus the
+#number of cars that have already left, without scanning the queue.
+#Head cars blocked by a full node wait in that node's waiter list and are woken
+#when the node frees a slot, instead of polling every time unit.
+#Cars that count towards a node without being in its queue are held: the cars
+#of a parking lot not released yet and the cars that came out at an exit.
+#A lot makes its cars one at a time, see handleRelease: firstId is the id of its
+#first car, released the number let go so far and lastRelease the offset of the
+#last one from its arrival process.
+#Routing data (street children, exit child, east facing children, direction) is
+#filled in once by Network.compile, see Network.py; the getters just return it.
+#remote and lent are only set in parallel runs, see parallel.py.
 class Node:
     TYPE_STREET = 0
     TYPE_PARKING = 1
+    remote = False
+    lent = False
     def __init__(self, type, start, end, capacity, minTravelTime, id, comment='', exit=False):
         assert(type == Node.TYPE_PARKING or type == Node.TYPE_STREET)
         self.type = type
@@ -72,19 +88,43 @@ class Node:
         self.cop = 0
         self.copleft = 0
         self.maxMinTravelTimeforAll = 0
-        self.__cars = []
+        self.__cars = deque()
+        self.held = 0
+        self.firstId = 0
+        self.released = 0
+        self.lastRelease = None
+        self.__entered = 0
+        self.__exited = 0
+        self.__waiters = []
         self.__children = []
+        self.index = -1
+        self.children = ()
+        self.exitChildNdx = -1
+        self.eastChildNdx = ()
+        self.direction = getDirection(self)
 
+    #Cars are integer handles into a CarStore. Returns the car's sequence number
     def enterCar(self, car):
         assert(self.canEnterCar())
-        assert(isinstance(car, Car))
         self.__cars.append(car)
-        car.setCurrentNode(self)
+        self.__entered += 1
+        return self.__entered - 1
 
     def exitCar(self):
-        return self.__cars.pop(0)
+        self.__exited += 1
+        return self.__cars.popleft()
+    def headCar(self):
+        if(len(self.__cars) == 0):
+            return None
+        return self.__cars[0]
+    def addWaiter(self, car, token):
+        self.__waiters.append((car, token))
+    def popWaiters(self):
+        waiters = self.__waiters
+        self.__waiters = []
+        return waiters
     def carCount(self):
-        return len(self.__cars)
+        return len(self.__cars) + self.held
     def canEnterCar(self):
         return(self.carCount() < self.capacity)
     def canEnterCarOnStreet(self):
@@ -99,60 +139,74 @@ class Node:
         self.maxMinTravelTimeforAll = maxTravel
     def addChildNode(self, node):
         assert(isinstance(node, Node))
+        assert(self.index == -1)
         self.__children.append(node)
-    def getCarPosition(self, car):
-        assert(isinstance(car, Car))
-        ndx = 0
-        for iCar in self.__cars:
-            if(car.id == iCar.id):
-                return ndx
-            ndx += 1
-        return -1
+    def getAllChildren(self):
+        return self.__children
+    def compile(self, index, children, exitChildNdx, eastChildNdx):
+        self.index = index
+        self.children = tuple(children)
+        self.exitChildNdx = exitChildNdx
+        self.eastChildNdx = tuple(eastChildNdx)
+    #Children are pickled as network indices so saving a big network does not
+    #recurse from node to node; Network links them back when it is loaded.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_Node__children'] = [child.index for child in self.__children]
+        state['children'] = [child.index for child in self.children]
+        return state
+    def relink(self, nodes):
+        self.__children = [nodes[ndx] for ndx in self.__children]
+        self.children = tuple(nodes[ndx] for ndx in self.children)
+    #Position in the queue of the car that entered with sequence number seq
+    def getCarPosition(self, seq):
+        if(seq < self.__exited or seq >= self.__entered):
+            return -1
+        return seq - self.__exited
     def getChildren(self):
-        childrenNode = self.__children
-        for child in childrenNode:
-            if(child.type == Node.TYPE_PARKING):
-                childrenNode.remove(child)
-        return childrenNode
+        return self.children
     def getExitChild(self):
-        childrenNode = self.getChildren()
-        exitChild_ndx = []
-        for child in childrenNode:
-            if(child.exit):
-                exitChild_ndx.append(childrenNode.index(child))
-        return exitChild_ndx
-    def getChildByCop(self):
-        childrenNode = self.getChildren()
+        if(self.exitChildNdx == -1):
+            return []
+        return [self.exitChildNdx]
+    #Position of the child the cop sends cars to, -1 if there is no cop.
+    #With a RoutingPolicy the time term is the child's congested time to exit
+    #DEPTH_OF_AWARENESS hops ahead instead of its own minTravelTime.
+    def getChildByCop(self, routing=None):
+        childrenNode = self.children
         congestion = self.carCount()/self.capacity
         intersection = len(childrenNode)
-        if(IF_MUTATE):
-            ifCop = ((congestion >= COP_CONGESTION_THRESHOLD) or (self.start in DEAD_END)) and (intersection >= COP_INTERSECTION_THRESHOLD) and not self.copleft
+        if(parameters.IF_MUTATE):
+            ifCop = ((congestion >= parameters.COP_CONGESTION_THRESHOLD) or (self.start in parameters.DEAD_END)) and (intersection >= parameters.COP_INTERSECTION_THRESHOLD) and not self.copleft
         else:
-            ifCop = (intersection >= COP_INTERSECTION_THRESHOLD) and not self.copleft
+            ifCop = (intersection >= parameters.COP_INTERSECTION_THRESHOLD) and not self.copleft
         self.setCop(ifCop)
         if(ifCop):
-            children_available = []
-            children_traveltime = []
-            children_decision = []
-            for child in childrenNode:
-                children_available.append(child.carCount()/child.capacity)
-                children_traveltime.append(child.minTravelTime/child.maxMinTravelTimeforAll)
-                children_decision.append(SPACE_TIME_TRADEOFF*child.carCount()/child.capacity + (1-SPACE_TIME_TRADEOFF)*child.minTravelTime/child.maxMinTravelTimeforAll)
-            return children_decision.index(min(children_decision))
+            tradeoff = parameters.SPACE_TIME_TRADEOFF
+            if(routing is not None):
+                travelTimes = routing.childCosts(self)
+                longest = max(travelTimes.max(), 1)
+            best = -1
+            bestDecision = 0
+            for (ndx, child) in enumerate(childrenNode):
+                if(routing is not None):
+                    travelTime = travelTimes[ndx] / longest
+                else:
+                    travelTime = child.minTravelTime/child.maxMinTravelTimeforAll
+                decision = tradeoff*child.carCount()/child.capacity + (1-tradeoff)*travelTime
+                if(best == -1 or decision < bestDecision):
+                    best = ndx
+                    bestDecision = decision
+            return best
         else:
             return -1
     def getDirection(self):
-        return getDirection(self)
+        return self.direction
     def isTowardEast(self):
-        direction = self.getDirection()
+        direction = self.direction
         return (direction >= 0 and direction <= 60) or (direction >= 300 and direction <= 360) or self.exit
     def childrenTowardEast(self):
-        childrenNode = self.getChildren()
-        children_east_ndx = []
-        for child in childrenNode:
-            if(child.isTowardEast()):
-                children_east_ndx.append(childrenNode.index(child))
-        return children_east_ndx
+        return self.eastChildNdx
     #To string to be used by print()
     def __repr__(self):
         if(self.type == Node.TYPE_STREET):
@@ -164,7 +218,7 @@ class Node:
             string += " is an exit. "
             string += " From " + str(self.start) + " To " + str(self.end) \
                 + " Capacity: " + str(self.capacity) + " Current: " + str(self.carCount()) + "\n"
-        if(DEBUG and len(self.__children) > 0):
+        if(parameters.DEBUG and len(self.__children) > 0):
             string += " Children: \n"
             for child in self.__children:
                 if(child.type == Node.TYPE_STREET):
@@ -174,157 +228,360 @@ class Node:
                 string += nodeType + " ID: " + str(child.id) + " capacity: " + str(child.capacity) +"\n"
         return string
 
-#Car object to keep track of the car's current location and its path.
-class Car:
-    def __init__(self, id):
-        self.__currentNode = None
-        self.__path = []
-        self.id = id
-    def setCurrentNode(self, currentNode):
-        assert(currentNode != self.__currentNode)
-        assert(isinstance(currentNode, Node))
-        self.__currentNode = currentNode
-        self.__path.append(currentNode)
-    def getDirection(self):
-        return getDirection(self.__currentNode)
-    def getCurrentNode(self):
-        return self.__currentNode
-    def getPath(self):
-        return self.__path
-    def __str__(self):
-        string = "Car id: " + str(self.id) + " at location: " + str(self.__currentNode.start)
-        if(len(self.__currentNode.getChildren())> 0):
-            string += " Children: \n"
-            for child in self.__currentNode.getChildren():
-                if(child.type == Node.TYPE_STREET):
-                    nodeType = "\tStreet"
-                else:
-                    nodeType = "\tParking"
-                string += nodeType + " ID: " + str(child.id) + " capacity: " + str(child.capacity) +"\n"
-        return string
+#Growable one dimensional numpy buffer, doubles its storage when full.
+class GrowableArray:
+    def __init__(self, dtype, capacity=1024):
+        self.__data = np.empty(max(capacity, 1), dtype=dtype)
+        self.size = 0
+    def append(self, value):
+        if(self.size == len(self.__data)):
+            data = np.empty(2 * len(self.__data), dtype=self.__data.dtype)
+            data[:self.size] = self.__data
+            self.__data = data
+        self.__data[self.size] = value
+        self.size += 1
+    def values(self):
+        return self.__data[:self.size]
+
+#Struct of arrays for the cars in the network. A car is an integer handle into
+#the columns:
+#   id: car id, starting at 1
+#   node: network index of the node the car is on, -1 before it is placed
+#   entryTime: time the car left its parking lot, nan until then
+#   exitTime: time the car reached an exit, nan until then
+#The remaining columns are engine state: the car's sequence number in its
+#node's queue and its wake-on-capacity wait state.
+#Cars are made when their lot releases them and their handle is released once
+#their exit is recorded, so the columns only grow to the most cars in the
+#network at once: size is that high water mark and live the cars in it now. A
+#released handle is handed out again with its columns reset, bar waitToken,
+#which keeps counting so stale waiter entries never match the new car.
+#Paths are recorded as (car id, node index) int32 pairs appended to one buffer.
+#pathMode is 'off', 'sampled' (every pathSample-th car) or 'full'.
+class CarStore:
+    PATH_OFF = 'off'
+    PATH_SAMPLED = 'sampled'
+    PATH_FULL = 'full'
+    def __init__(self, capacity=1024, pathMode=PATH_OFF, pathSample=100):
+        assert(pathMode in (CarStore.PATH_OFF, CarStore.PATH_SAMPLED, CarStore.PATH_FULL))
+        assert(pathSample > 0)
+        self.size = 0
+        self.live = 0
+        self.__free = []
+        self.pathMode = pathMode
+        self.pathSample = pathSample
+        self.__allocate(max(capacity, 1))
+        self.pathCar = GrowableArray(np.int32)
+        self.pathNode = GrowableArray(np.int32)
+    def __allocate(self, capacity):
+        columns = {'id': (np.int64, 0), 'node': (np.int32, -1), 'entryTime': (np.float64, np.nan), \
+            'exitTime': (np.float64, np.nan), 'queueSeq': (np.int64, -1), 'waitToken': (np.int64, 0), \
+            'waitType': (np.int8, -1), 'waitSince': (np.float64, 0), 'waitStep': (np.float64, 1)}
+        for (name, (dtype, default)) in columns.items():
+            column = np.full(capacity, default, dtype=dtype)
+            if(self.size > 0):
+                column[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, column)
+        self.capacity = capacity
+    #Add a car and return its handle
+    def add(self, id):
+        if(len(self.__free) > 0):
+            car = self.__free.pop()
+        else:
+            if(self.size == self.capacity):
+                self.__allocate(2 * self.capacity)
+            car = self.size
+            self.size += 1
+        self.id[car] = id
+        self.live += 1
+        return car
+    #Free the handle of a car that left the network
+    def release(self, car):
+        self.node[car] = -1
+        self.entryTime[car] = np.nan
+        self.exitTime[car] = np.nan
+        self.queueSeq[car] = -1
+        self.waitType[car] = -1
+        self.waitSince[car] = 0
+        self.waitStep[car] = 1
+        self.live -= 1
+        self.__free.append(car)
+    #Put car at the back of node's queue
+    def enter(self, car, node):
+        assert(self.node[car] != node.index)
+        self.queueSeq[car] = node.enterCar(car)
+        self.node[car] = node.index
+        self.__record(car, node)
+    #Count car as out at the exit node instead of queueing it there
+    def exit(self, car, node):
+        node.held += 1
+        self.node[car] = node.index
+        self.__record(car, node)
+    def __record(self, car, node):
+        if(self.pathMode == CarStore.PATH_FULL or \
+            (self.pathMode == CarStore.PATH_SAMPLED and self.id[car] % self.pathSample == 0)):
+            self.pathCar.append(self.id[car])
+            self.pathNode.append(node.index)
+    #Node indices visited by the car with the given id, in order
+    def getPath(self, id):
+        return self.pathNode.values()[self.pathCar.values() == id]
+
+#Everything one run owns: the compiled network, the car store, the future event
+#list and the exit-aware routing policy, None unless ROUTING_POLICY is 'exit' or
+#DRIVER_AWARENESS is set. Handlers get it as their first argument. release is
+#the arrival process of the parking lots, see Arrivals.py, and population the
+#number of cars parked at the start.
+class World:
+    def __init__(self, network, cars, events, routing=None, random=None, release=None):
+        self.network = network
+        self.nodes = network.nodes
+        self.cars = cars
+        self.events = events
+        self.routing = routing
+        self.random = random
+        self.release = release
+        self.population = 0
+        self.triggers = None
+        self.instrumentation = None
+        self.partition = None
+    def getCurrentNode(self, car):
+        return self.nodes[self.cars.node[car]]
 
-def genericHandler(events, event, time, type):
+#Counters for the wake-on-capacity blocking. retriesAvoided is the number of
+#retry events the old time + 1 / time + carNdx polling would have scheduled.
+blockingStats = {'sleeps': 0, 'wakes': 0, 'retriesAvoided': 0}
+
+def resetBlockingStats():
+    for key in blockingStats:
+        blockingStats[key] = 0
+
+#Put a blocked car to sleep. It schedules no event until wakeCar is called.
+#step is the polling interval the car would otherwise have retried at.
+def sleepCar(world, car, type, time, step):
+    cars = world.cars
+    cars.waitToken[car] += 1
+    cars.waitType[car] = type
+    cars.waitSince[car] = time
+    cars.waitStep[car] = step
+    blockingStats['sleeps'] += 1
+
+#Reschedule a sleeping car one time unit after it was released, the same
+#headway the polling retries used. Stale wake ups are ignored.
+def wakeCar(world, car, time):
+    cars = world.cars
+    type = int(cars.waitType[car])
+    if(type == -1):
+        return
+    blockingStats['wakes'] += 1
+    blockingStats['retriesAvoided'] += int((time - cars.waitSince[car]) / cars.waitStep[car])
+    cars.waitType[car] = -1
+    cars.waitToken[car] += 1
+    world.events.schedule(time + 1, car, type)
+
+#Called after a car left node: wake the new head if it was waiting for its turn
+#and every car waiting for a free slot on node.
+def releaseSlot(world, node, time):
+    head = node.headCar()
+    if(head is not None):
+        wakeCar(world, head, time)
+    for (car, token) in node.popWaiters():
+        if(world.cars.waitToken[car] == token):
+            wakeCar(world, car, time)
+
+#Move the head car of node onto childNode and schedule its arrival at the end.
+#In a parallel run a childNode owned by another partition is a RemoteStreet and
+#the arrival is sent there instead.
+def moveCar(world, car, node, childNode, time):
+    cars = world.cars
+    exitedCar = node.exitCar()
+    assert(exitedCar == car)
+    if(node.lent):
+        world.partition.leave(world, car, node, time)
+    if(node.type == Node.TYPE_PARKING):
+        cars.entryTime[car] = time
+        scheduleRelease(world, node, time)
+    cars.enter(car, childNode)
+    if(world.routing is not None):
+        world.routing.update(node)
+        world.routing.update(childNode)
+    releaseSlot(world, node, time)
+    newTime = time + world.random.travel.exponential(node.minTravelTime)
+    if(childNode.remote):
+        world.partition.send(world, car, childNode, newTime)
+    else:
+        world.events.schedule(newTime, car, Event.TYPE_ON_STREET)
+
+def genericHandler(world, event, time, type):
     #Check car's position in exit queue
     car = event.car
     assert(car != None)
-    node = car.getCurrentNode()
-    assert(node != None)
-    carNdx = node.getCarPosition(car)
+    node = world.getCurrentNode(car)
+    carNdx = node.getCarPosition(world.cars.queueSeq[car])
     assert(carNdx != -1)
     
-    #can't exit
+    #can't exit, wait for the car ahead to leave
     if(carNdx > 0):
-        time = time + carNdx
-        heappush(events, (time, Event(car, type)))
+        if(world.instrumentation is not None):
+            world.instrumentation.queued[node.index] += 1
+        sleepCar(world, car, type, time, carNdx)
         return
     
-    if(len(node.getChildren()) > 1):
+    childrenNode = node.children
+    if(len(childrenNode) > 1):
         #insert new "at intersection" event
-        newEvent = Event(car, Event.TYPE_AT_INTERSECTION) 
-        heappush(events, (time + 1, newEvent))
+        world.events.schedule(time + 1, car, Event.TYPE_AT_INTERSECTION)
     else:
         #can exit.
-        assert(len(node.getChildren()) == 1)
+        assert(len(childrenNode) == 1)
         
-        childNode = node.getChildren()[0]
+        childNode = childrenNode[0]
         #insert exit event
         if(childNode.exit):
             newTime = time + 1
-            newEvent = Event(car, Event.TYPE_EXIT)
-            heappush(events, (newTime, newEvent))
+            world.events.schedule(newTime, car, Event.TYPE_EXIT)
             return
 
 
         #insert "on street" event   
         if(childNode.canEnterCarOnStreet()):
-            exitedCar = node.exitCar()
-            assert(exitedCar.id == car.id)
-            childNode.enterCar(car)
-            newTime = time + genRandom(node.minTravelTime)
-            newEvent = Event(car, Event.TYPE_ON_STREET)
-            heappush(events, (newTime, newEvent))
+            moveCar(world, car, node, childNode, time)
         else:
-            #print("Car " + str(car.id) + " is backed up.")
-            time = time + 1
-            heappush(events, (time, Event(car, type)))
+            #print("Car " + str(car) + " is backed up.")
+            if(world.instrumentation is not None):
+                world.instrumentation.backedUp[node.index] += 1
+            sleepCar(world, car, type, time, 1)
+            childNode.addWaiter(car, world.cars.waitToken[car])
 
-def handleParking(events, event, time):
-    genericHandler(events, event, time, Event.TYPE_IN_PARKING)
+def handleParking(world, event, time):
+    genericHandler(world, event, time, Event.TYPE_IN_PARKING)
 
-def handleOnStreet(events, event, time):
-    genericHandler(events, event, time, Event.TYPE_ON_STREET)
+def handleOnStreet(world, event, time):
+    genericHandler(world, event, time, Event.TYPE_ON_STREET)
 
-def handleIntersection(events, event, time):
+def handleIntersection(world, event, time):
     car = event.car
     assert(car != None)
-    node = car.getCurrentNode()
-    assert(node != None)
+    node = world.getCurrentNode(car)
         
-    childrenNode = node.getChildren()
+    childrenNode = node.children
     childNode = -1
-    if(node.getExitChild()):
-        childNode = childrenNode[node.getExitChild()[0]]
-    if(childNode==-1 and COP_MODE):
-        childByCop_ndx = node.getChildByCop()
+    if(node.exitChildNdx != -1):
+        childNode = childrenNode[node.exitChildNdx]
+    if(childNode==-1 and parameters.COP_MODE):
+        childByCop_ndx = node.getChildByCop(world.routing)
         if(childByCop_ndx != -1):
             childNode = childrenNode[childByCop_ndx] 
         else:
             childNode = -1
 
-    if(childNode == -1 and EAST_TENDENCY!=0):
-        to_east_node_ndx = node.childrenTowardEast()            
+    if(childNode == -1 and parameters.DRIVER_AWARENESS > 0 and len(childrenNode) > 1):
+        #An aware driver takes the quickest way out it can see
+        if(world.random.turning.uniform() < parameters.DRIVER_AWARENESS):
+            childNode = childrenNode[world.routing.bestChild(node)]
+
+    if(childNode == -1 and parameters.EAST_TENDENCY!=0):
+        to_east_node_ndx = node.eastChildNdx
         if(to_east_node_ndx):
             east_node = [childrenNode[i] for i in to_east_node_ndx]
-            prob = [genRandom(1,type='uniform') for x in to_east_node_ndx]
-            tendency = [x - (1 - EAST_TENDENCY) for x in prob]
+            prob = [world.random.turning.uniform() for x in to_east_node_ndx]
+            tendency = [x - (1 - parameters.EAST_TENDENCY) for x in prob]
             if(max(tendency)>0):
                 max_node_ndx = tendency.index(max(tendency))
                 childNode = childrenNode[to_east_node_ndx[max_node_ndx]]
     if(childNode==-1):
         if(len(childrenNode) > 1):
-            rand = math.floor(genRandom(len(childrenNode), type = 'uniform'))
+            rand = math.floor(world.random.turning.uniform(len(childrenNode)))
         else:
             rand = 0
         childNode = childrenNode[rand]
 
     if(childNode.exit):
         newTime = time + 1
-        newEvent = Event(car, Event.TYPE_EXIT)
-        heappush(events, (newTime, newEvent))
+        world.events.schedule(newTime, car, Event.TYPE_EXIT)
         return
 
     #insert "on street" event   
     if(childNode.canEnterCarOnStreet()):
-        exitedCar = node.exitCar()
-        assert(exitedCar.id == car.id)        
-        childNode.enterCar(car)
-        newTime = time + genRandom(node.minTravelTime)
-        newEvent = Event(car, Event.TYPE_ON_STREET)
-        heappush(events, (newTime, newEvent))
-    else:
-        #print("Car " + str(car.id) + " is backed up.")
+        moveCar(world, car, node, childNode, time)
+    elif(any(child.canEnterCarOnStreet() for child in childrenNode)):
+        #Another turn is open, retry with a fresh choice
+        if(world.instrumentation is not None):
+            world.instrumentation.retries[node.index] += 1
         time = time + 1
-        heappush(events, (time, Event(car, Event.TYPE_AT_INTERSECTION)))
+        world.events.schedule(time, car, Event.TYPE_AT_INTERSECTION)
+    else:
+        #print("Car " + str(car) + " is backed up.")
+        #Every turn is full, sleep until one of them frees a slot
+        if(world.instrumentation is not None):
+            world.instrumentation.backedUp[node.index] += 1
+        sleepCar(world, car, Event.TYPE_AT_INTERSECTION, time, 1)
+        token = world.cars.waitToken[car]
+        for child in childrenNode:
+            child.addWaiter(car, token)
 
-def handleExit(events, event, time):
+def handleExit(world, event, time):
     car = event.car
     assert(car != None)
-    node = car.getCurrentNode()
-    assert(node != None)
+    node = world.getCurrentNode(car)
     exitedCar = node.exitCar()
-    assert(exitedCar.id == car.id)
-    for exitNode in node.getChildren():
-        if exitNode.exit:
-            exitNode.enterCar(car)
-            break
+    assert(exitedCar == car)
+    if(node.type == Node.TYPE_PARKING):
+        world.cars.entryTime[car] = time
+        scheduleRelease(world, node, time)
+    if(node.lent):
+        world.partition.leave(world, car, node, time)
+    if(world.routing is not None):
+        world.routing.update(node)
+    releaseSlot(world, node, time)
+    assert(node.exitChildNdx != -1)
+    world.cars.exit(car, node.children[node.exitChildNdx])
+    world.cars.exitTime[car] = time
+
+#Schedule the release of the next car of lot, if it has cars left, after the car
+#before it drove off at time. A car due by then leaves one time unit later, the
+#headway of a car woken when the one ahead of it goes.
+def scheduleRelease(world, lot, time):
+    if(lot.held == 0):
+        return
+    lot.lastRelease = world.release.offset(lot, lot.released, lot.lastRelease, world.random.parking)
+    release = lot.minTravelTime + lot.lastRelease
+    world.events.schedule(release if release > time else time + 1, lot.index, Event.TYPE_RELEASE)
+
+#A parking lot lets its next car go: event.car is the lot's index. The car is
+#made, joins the lot and is handled like any car in a parking lot. The lot's
+#following car is scheduled once this one has left, so a lot holds at most one
+#car that exists.
+def handleRelease(world, event, time):
+    lot = world.nodes[event.car]
+    cars = world.cars
+    car = cars.add(lot.firstId + lot.released)
+    lot.held -= 1
+    lot.released += 1
+    cars.enter(car, lot)
+    event.car = car
+    genericHandler(world, event, time, Event.TYPE_IN_PARKING)
+
+#Parallel runs only, see parallel.py: a car arriving from another partition and
+#any other message from one, event.car being the message's key
+def handleArrival(world, event, time):
+    world.partition.arrive(world, event, time)
+
+def handleMessage(world, event, time):
+    world.partition.receive(world, event.car, time)
     
+#Event records are recycled by the scheduler, see Scheduler.py. reset() rebinds
+#a record to a new car handle and type.
 class Event:
     TYPE_IN_PARKING = 0
     TYPE_ON_STREET = 1
     TYPE_AT_INTERSECTION = 2
     TYPE_EXIT = 3
+    TYPE_ARRIVAL = 4
+    TYPE_MESSAGE = 5
+    TYPE_RELEASE = 6
     def __init__(self, car, type):
-        assert(isinstance(car, Car))
+        self.reset(car, type)
+    def reset(self, car, type):
         self.car = car
         self.type = type
         if(type == Event.TYPE_IN_PARKING):
@@ -335,5 +592,11 @@ class Event:
             self.eventHandler = handleIntersection
         elif(type == Event.TYPE_EXIT):
             self.eventHandler = handleExit
+        elif(type == Event.TYPE_ARRIVAL):
+            self.eventHandler = handleArrival
+        elif(type == Event.TYPE_MESSAGE):
+            self.eventHandler = handleMessage
+        elif(type == Event.TYPE_RELEASE):
+            self.eventHandler = handleRelease
         else:
-            raise Exception('Uknown Event type: ' + type)
\ No newline at end of file
+            raise Exception('Uknown Event type: ' + str(type))
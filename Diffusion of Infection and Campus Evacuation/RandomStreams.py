@@ -0,0 +1,64 @@
+import numpy as np
+
+#One named stream of variates with its own generator.
+#Variates are generated a block at a time and handed out one by one as Python
+#floats, so a draw is a list lookup instead of a numpy call. Each distribution
+#has its own block, so how many exponential draws were made never shifts the
+#uniform ones.
+class RandomStream:
+    def __init__(self, seedSequence, blockSize):
+        assert(blockSize > 0)
+        self.generator = np.random.default_rng(seedSequence)
+        self.blockSize = blockSize
+        self.__exponential = []
+        self.__exponentialNdx = 0
+        self.__uniform = []
+        self.__uniformNdx = 0
+        self.__normal = []
+        self.__normalNdx = 0
+    #Same distributions as genRandom: l + Exp(1), U(0, l) and N(l, 1)
+    def exponential(self, l=5):
+        if(self.__exponentialNdx == len(self.__exponential)):
+            self.__exponential = self.generator.standard_exponential(self.blockSize).tolist()
+            self.__exponentialNdx = 0
+        value = self.__exponential[self.__exponentialNdx]
+        self.__exponentialNdx += 1
+        return value + l
+    def uniform(self, l=1):
+        if(self.__uniformNdx == len(self.__uniform)):
+            self.__uniform = self.generator.random(self.blockSize).tolist()
+            self.__uniformNdx = 0
+        value = self.__uniform[self.__uniformNdx]
+        self.__uniformNdx += 1
+        return value * l
+    def normal(self, l=0):
+        if(self.__normalNdx == len(self.__normal)):
+            self.__normal = self.generator.standard_normal(self.blockSize).tolist()
+            self.__normalNdx = 0
+        value = self.__normal[self.__normalNdx]
+        self.__normalNdx += 1
+        return value + l
+
+#Random number service of one run, one independent stream per source of
+#randomness in the model:
+#   parking: release times of the parked cars
+#   travel:  time to drive a street
+#   turning: choices at intersections
+#Every stream is spawned from the run seed in a fixed order, so two runs with
+#the same seed see the same parking release times and the same sequence of
+#travel times and turning draws whatever policy they use: common random
+#numbers. A policy that makes extra turning draws no longer shifts the travel
+#times of everybody else. seed None takes fresh entropy, kept in self.seed so
+#the run can be repeated.
+class RandomStreams:
+    STREAMS = ('parking', 'travel', 'turning')
+    def __init__(self, seed=None, blockSize=4096):
+        root = np.random.SeedSequence(seed)
+        self.seed = root.entropy
+        children = root.spawn(len(RandomStreams.STREAMS))
+        for (name, child) in zip(RandomStreams.STREAMS, children):
+            setattr(self, name, RandomStream(child, blockSize))
+    def stream(self, name):
+        if(name not in RandomStreams.STREAMS):
+            raise Exception('Unknown random stream: ' + str(name))
+        return getattr(self, name)
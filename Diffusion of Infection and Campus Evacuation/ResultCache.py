@@ -0,0 +1,150 @@
+import os
+import json
+import pickle
+import hashlib
+import parameters
+
+CURRENT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+
+#Source files whose code decides the outcome of a run
+ENGINE_FILES = ['simulator.py', 'Objects.py', 'Network.py', 'Scheduler.py', 'RandomStreams.py', 'Routing.py', \
+    'Arrivals.py', 'Statistics.py', 'Triggers.py']
+
+#Hash of the engine sources: results cached by other code never match
+def engineVersion():
+    digest = hashlib.sha256()
+    for fileName in ENGINE_FILES:
+        with open(os.path.join(CURRENT_DIRECTORY, fileName), 'rb') as f:
+            digest.update(fileName.encode() + b'\0' + f.read() + b'\0')
+    return digest.hexdigest()
+
+#Content-addressed cache of finished runs.
+#A run is keyed by a SHA-256 of the world file's contents, every value in
+#parameters.py as the run sees it, the seed and the engine version, so a key
+#only ever matches a run that would come out the same. Each result is pickled
+#to entries/<key>.pkl; index.json keeps per key its size, engine version and
+#when it was last used. Once the entries take more than maxBytes the least
+#recently used are evicted. Changing the engine code changes every key; the
+#results of older code stay until invalidate() removes them or LRU gets to
+#them, and clear() empties the cache.
+class ResultCache:
+    INDEX_FILE = 'index.json'
+    def __init__(self, path, maxBytes=None):
+        self.path = path
+        self.maxBytes = parameters.CACHE_SIZE if maxBytes is None else maxBytes
+        self.engine = engineVersion()
+        self.hits = 0
+        self.misses = 0
+        self.__worlds = {}
+        self.__dirty = False
+        if(not os.path.isdir(os.path.join(path, 'entries'))):
+            os.makedirs(os.path.join(path, 'entries'))
+        indexFile = os.path.join(path, ResultCache.INDEX_FILE)
+        if(os.path.exists(indexFile)):
+            with open(indexFile) as f:
+                self.__index = json.load(f)
+        else:
+            self.__index = {'clock': 0, 'bytes': 0, 'entries': {}}
+
+    #Key of a run of worldFile with seed under the current parameters.py values
+    #overridden by params
+    def key(self, worldFile, seed, params=None):
+        stat = os.stat(worldFile)
+        world = self.__worlds.get(worldFile)
+        if(world is None or world[0] != (stat.st_mtime, stat.st_size)):
+            with open(worldFile, 'rb') as f:
+                world = ((stat.st_mtime, stat.st_size), hashlib.sha256(f.read()).hexdigest())
+            self.__worlds[worldFile] = world
+        values = dict((name, getattr(parameters, name)) for name in dir(parameters) if name.isupper())
+        for (name, value) in (params or {}).items():
+            if(name not in values):
+                raise Exception('Unknown parameter: ' + name)
+            values[name] = value
+        text = repr((world[1], sorted(values.items()), seed, self.engine))
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def __entryFile(self, key):
+        return os.path.join(self.path, 'entries', key + '.pkl')
+
+    def __touch(self, key):
+        self.__index['clock'] += 1
+        self.__index['entries'][key]['used'] = self.__index['clock']
+        self.__dirty = True
+
+    #The result cached under key, None on a miss
+    def get(self, key):
+        if(key not in self.__index['entries']):
+            self.misses += 1
+            return None
+        try:
+            with open(self.__entryFile(key), 'rb') as f:
+                result = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            self.__drop(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.__touch(key)
+        return result
+
+    #Cache result under key and evict what no longer fits
+    def put(self, key, result):
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        entryFile = self.__entryFile(key)
+        with open(entryFile + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(entryFile + '.tmp', entryFile)
+        if(key in self.__index['entries']):
+            self.__index['bytes'] -= self.__index['entries'][key]['size']
+        self.__index['entries'][key] = {'size': len(data), 'engine': self.engine, 'used': 0}
+        self.__index['bytes'] += len(data)
+        self.__touch(key)
+        self.__evict()
+        self.flush()
+
+    def __drop(self, key):
+        entry = self.__index['entries'].pop(key)
+        self.__index['bytes'] -= entry['size']
+        self.__dirty = True
+        if(os.path.exists(self.__entryFile(key))):
+            os.remove(self.__entryFile(key))
+
+    def __evict(self):
+        if(self.__index['bytes'] <= self.maxBytes):
+            return
+        entries = self.__index['entries']
+        for key in sorted(entries, key=lambda key: entries[key]['used']):
+            if(self.__index['bytes'] <= self.maxBytes):
+                break
+            self.__drop(key)
+
+    #Drop the results of engine code other than the current one, or of every
+    #engine when allEngines is set. Returns how many were dropped.
+    def invalidate(self, allEngines=False):
+        stale = [key for (key, entry) in self.__index['entries'].items() if allEngines or entry['engine'] != self.engine]
+        for key in stale:
+            self.__drop(key)
+        self.flush()
+        return len(stale)
+
+    def clear(self):
+        return self.invalidate(allEngines=True)
+
+    #Write the index back if lookups changed it
+    def flush(self):
+        if(not self.__dirty):
+            return
+        indexFile = os.path.join(self.path, ResultCache.INDEX_FILE)
+        with open(indexFile + '.tmp', 'w') as f:
+            json.dump(self.__index, f)
+        os.replace(indexFile + '.tmp', indexFile)
+        self.__dirty = False
+
+    def bytes(self):
+        return self.__index['bytes']
+
+    def __len__(self):
+        return len(self.__index['entries'])
+
+    def __contains__(self, key):
+        return key in self.__index['entries']
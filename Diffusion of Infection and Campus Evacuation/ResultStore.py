@@ -0,0 +1,121 @@
+import os
+import re
+import json
+import glob
+import numpy as np
+
+#Columnar store for evacuation runs.
+#A store is a directory of shards plus an index. Each shard (shard-00000.npz)
+#holds the exit curves of one batch of runs concatenated into two columns,
+#times (float64) and exited (int32), with offsets marking where each run
+#starts. index.json has one record per run: its id, parameters, seed, shard,
+#row range and summary statistics when the run has them. Queries are answered from the index alone and only the shards that
+#hold matching runs are opened.
+class ResultStore:
+    INDEX_FILE = 'index.json'
+    def __init__(self, path):
+        self.path = path
+        if(not os.path.isdir(path)):
+            os.makedirs(path)
+        indexFile = os.path.join(path, ResultStore.INDEX_FILE)
+        if(os.path.exists(indexFile)):
+            with open(indexFile) as f:
+                self.__index = json.load(f)
+        else:
+            self.__index = {'shards': 0, 'runs': []}
+
+    #Write a batch of runs as one new shard. Every run is a dictionary with
+    #'params', 'seed', 'exitTimes', 'exitedCount' and optionally 'stats', a JSON
+    #friendly dictionary of metrics. Returns the new run ids.
+    def write(self, runs):
+        if(len(runs) == 0):
+            return []
+        shard = 'shard-%05d.npz' % self.__index['shards']
+        offsets = np.zeros(len(runs) + 1, dtype=np.int64)
+        for (ndx, run) in enumerate(runs):
+            assert(len(run['exitTimes']) == len(run['exitedCount']))
+            offsets[ndx + 1] = offsets[ndx] + len(run['exitTimes'])
+        times = np.concatenate([np.asarray(run['exitTimes'], dtype=np.float64) for run in runs])
+        exited = np.concatenate([np.asarray(run['exitedCount'], dtype=np.int32) for run in runs])
+        np.savez(os.path.join(self.path, shard), times=times, exited=exited, offsets=offsets)
+        ids = []
+        for (ndx, run) in enumerate(runs):
+            id = len(self.__index['runs'])
+            self.__index['runs'].append({'id': id, 'shard': shard, 'start': int(offsets[ndx]), \
+                'stop': int(offsets[ndx + 1]), 'seed': run.get('seed'), 'params': run['params'], 'stats': run.get('stats')})
+            ids.append(id)
+        self.__index['shards'] += 1
+        self.__saveIndex()
+        return ids
+
+    def __saveIndex(self):
+        indexFile = os.path.join(self.path, ResultStore.INDEX_FILE)
+        with open(indexFile + '.tmp', 'w') as f:
+            json.dump(self.__index, f)
+        os.replace(indexFile + '.tmp', indexFile)
+
+    #Index records of the runs whose parameters match every condition.
+    #A condition is NAME=value or NAME=[allowed values]; seed can be matched too.
+    def query(self, **conditions):
+        matches = []
+        for run in self.__index['runs']:
+            ok = True
+            for (name, wanted) in conditions.items():
+                value = run['seed'] if name == 'seed' else run['params'].get(name)
+                if(isinstance(wanted, (list, tuple, set))):
+                    ok = value in wanted
+                else:
+                    ok = value == wanted
+                if(not ok):
+                    break
+            if(ok):
+                matches.append(run)
+        return matches
+
+    #Load the exit curves of all matching runs as one set of arrays:
+    #(times, exited, runIds, offsets) where run runIds[i] occupies rows
+    #offsets[i]:offsets[i+1] of times and exited.
+    def load(self, **conditions):
+        runs = self.query(**conditions)
+        byShard = {}
+        for run in runs:
+            byShard.setdefault(run['shard'], []).append(run)
+        times = []
+        exited = []
+        runIds = []
+        offsets = [0]
+        for (shard, shardRuns) in sorted(byShard.items()):
+            with np.load(os.path.join(self.path, shard)) as data:
+                shardTimes = data['times']
+                shardExited = data['exited']
+                for run in shardRuns:
+                    times.append(shardTimes[run['start']:run['stop']])
+                    exited.append(shardExited[run['start']:run['stop']])
+                    runIds.append(run['id'])
+                    offsets.append(offsets[-1] + run['stop'] - run['start'])
+        if(len(runIds) == 0):
+            return (np.zeros(0), np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64))
+        return (np.concatenate(times), np.concatenate(exited), np.array(runIds, dtype=np.int64), np.array(offsets, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.__index['runs'])
+
+LEGACY_NAME = re.compile(r'Output[\d.]+ Cop (\S+) Cop intersection threshold (\S+) ' \
+    r'Cop evacuation threshold (\S+) East tendency (\S+)\.csv$')
+
+#Import the old per-run CSV files (data/Output<ts> Cop ... .csv) into store as
+#one shard, recovering the parameters from the file names.
+def importLegacy(store, pattern):
+    runs = []
+    for fileName in sorted(glob.glob(pattern)):
+        match = LEGACY_NAME.search(os.path.basename(fileName))
+        if(match is None):
+            continue
+        values = [json.loads(value) for value in match.groups()]
+        params = dict(zip(['COP_MODE', 'COP_INTERSECTION_THRESHOLD', 'COP_EVACUATION_THRESHOLD', 'EAST_TENDENCY'], values))
+        curve = np.loadtxt(fileName, delimiter=',', ndmin=2)
+        if(curve.size == 0):
+            curve = np.zeros((0, 2))
+        runs.append({'params': params, 'seed': None, 'exitTimes': np.concatenate(([0], curve[:, 0])), \
+            'exitedCount': np.concatenate(([0], curve[:, 1]))})
+    return store.write(runs)
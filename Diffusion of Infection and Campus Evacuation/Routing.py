@@ -0,0 +1,117 @@
+import numpy as np
+from heapq import heappush, heappop
+
+#Time to reach an exit from the start of every node of network: Dijkstra from
+#the exits over the reversed street connections, driving a node costing its
+#minTravelTime and exits costing nothing. Nodes that cannot reach an exit get inf.
+def timeToExit(network):
+    n = network.size
+    parents = [[] for i in range(n)]
+    for node in range(n):
+        for child in network.children(node):
+            parents[child].append(node)
+    dist = np.full(n, np.inf)
+    heap = []
+    for node in np.nonzero(network.isExit)[0]:
+        dist[node] = 0
+        heappush(heap, (0.0, int(node)))
+    while(len(heap) > 0):
+        (d, node) = heappop(heap)
+        if(d > dist[node]):
+            continue
+        for parent in parents[node]:
+            candidate = d + network.minTravelTime[parent]
+            if(candidate < dist[parent]):
+                dist[parent] = candidate
+                heappush(heap, (candidate, parent))
+    return dist
+
+#Exit-distance-aware routing with a DEPTH_OF_AWARENESS hop horizon.
+#The static time to exit is computed once. Inside the horizon a node costs its
+#minTravelTime scaled by 1 + congestionWeight * occupancy, and update(node)
+#refreshes that single entry whenever the node's car count changes. A path
+#through a child runs for up to depth nodes, stopping early at an exit or a
+#dead end, and costs the congested times of its nodes plus the static time to
+#exit from the end of its last node. The cheapest such path per child is found
+#by dynamic programming over the nodes within depth hops of the deciding node,
+#last hop first: every node is priced once per hop however many paths reach
+#it, so the work and memory grow with the nodes in reach instead of the paths.
+#Which nodes those are never changes, so a node works them out the first time
+#it decides and keeps them; scoring its children is then a gather and a
+#minimum per hop.
+class RoutingPolicy:
+    def __init__(self, network, depth=1, congestionWeight=1.0):
+        assert(depth >= 1)
+        self.network = network
+        self.depth = depth
+        self.congestionWeight = congestionWeight
+        n = network.size
+        tte = timeToExit(network)
+        finite = tte[np.isfinite(tte)]
+        #Dead ends are priced well above the slowest way out
+        self.unreachable = 10 * (finite.max() if len(finite) > 0 else 1) + 1
+        tte = np.where(np.isfinite(tte), tte, self.unreachable)
+        self.timeToExit = tte
+        self.cost = np.zeros(n)
+        self.afterEnd = np.where(network.isExit, 0, np.maximum(tte - network.minTravelTime, 0))
+        #Nodes a path ends at before its last hop
+        self.stops = network.isExit | (np.diff(network.childStart) == 0)
+        for node in network.nodes:
+            self.update(node)
+        self.__plans = {}
+
+    #Children of every node of nodes, grouped by node, and where each group starts
+    def __childrenOf(self, nodes):
+        childStart = self.network.childStart
+        counts = (childStart[nodes + 1] - childStart[nodes]).astype(np.int64)
+        firsts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        positions = np.arange(counts.sum()) + np.repeat(childStart[nodes] - firsts, counts)
+        return (self.network.childIndex[positions].astype(np.int64), firsts)
+
+    #Refresh the congested cost of one node after its car count changed
+    def update(self, node):
+        if(node.exit):
+            return
+        self.cost[node.index] = node.minTravelTime * (1 + self.congestionWeight * node.carCount() / node.capacity)
+
+    #Per hop from the last, (nodes, their afterEnd, positions of the nodes a
+    #path goes on from, their children's places in the next hop, where each
+    #node's children start) for the paths through the children of node ndx
+    def __plan(self, ndx):
+        (children, firsts) = self.__childrenOf(np.array([ndx]))
+        #The distinct nodes hop hops past the children
+        levels = [children]
+        for hop in range(1, self.depth):
+            onward = levels[-1][~self.stops[levels[-1]]]
+            if(len(onward) == 0):
+                break
+            levels.append(np.unique(self.__childrenOf(onward)[0]))
+        plan = []
+        for (hop, nodes) in enumerate(levels):
+            if(hop == len(levels) - 1):
+                plan.append((nodes, self.afterEnd[nodes], None, None, None))
+                continue
+            onward = np.nonzero(~self.stops[nodes])[0]
+            (nextNodes, firsts) = self.__childrenOf(nodes[onward])
+            plan.append((nodes, self.afterEnd[nodes], onward, np.searchsorted(levels[hop + 1], nextNodes), firsts))
+        plan.reverse()
+        return plan
+
+    #Expected time to exit through each child of node, in children order
+    def childCosts(self, node):
+        plan = self.__plans.get(node.index)
+        if(plan is None):
+            plan = self.__plan(node.index)
+            self.__plans[node.index] = plan
+        values = None
+        for (nodes, afterEnd, onward, nextPlaces, firsts) in plan:
+            cost = self.cost[nodes]
+            best = cost + afterEnd
+            if(onward is not None):
+                best[onward] = cost[onward] + np.minimum.reduceat(values[nextPlaces], firsts)
+            values = best
+        return values
+
+    #Position among node.children of the child with the quickest way out
+    def bestChild(self, node):
+        return int(np.argmin(self.childCosts(node)))
@@ -0,0 +1,135 @@
+from abc import ABCMeta, abstractmethod
+from heapq import heappush, heappop
+from Objects import Event
+
+#Future event list for the simulator.
+#schedule() hands out Event records from a free list that the simulation loop
+#refills with release(), so rescheduling a car does not allocate. Every entry
+#carries a sequence number, events at the same time are returned in the order
+#they were scheduled. A backend implements push, pop, peekTime and __len__.
+class EventScheduler(metaclass=ABCMeta):
+    def __init__(self):
+        self.__free = []
+        self.__seq = 0
+    def schedule(self, time, car, type):
+        if(len(self.__free) > 0):
+            event = self.__free.pop()
+            event.reset(car, type)
+        else:
+            event = Event(car, type)
+        self.push((time, self.__seq, event))
+        self.__seq += 1
+        return event
+    def release(self, event):
+        event.car = None
+        self.__free.append(event)
+    @abstractmethod
+    def push(self, item):
+        ...
+    #Return the earliest (time, event) and remove it from the list
+    @abstractmethod
+    def pop(self):
+        ...
+    #Time of the earliest event, left in the list
+    @abstractmethod
+    def peekTime(self):
+        ...
+    @abstractmethod
+    def __len__(self):
+        ...
+
+#Binary heap backend.
+class HeapScheduler(EventScheduler):
+    def __init__(self):
+        EventScheduler.__init__(self)
+        self.__heap = []
+    def push(self, item):
+        heappush(self.__heap, item)
+    def pop(self):
+        (time, seq, event) = heappop(self.__heap)
+        return (time, event)
+    def peekTime(self):
+        return self.__heap[0][0]
+    def __len__(self):
+        return len(self.__heap)
+
+#Calendar queue backend (R. Brown, 1988).
+#Events are hashed by time into bucketCount buckets of bucketWidth time units,
+#a "year" being bucketCount * bucketWidth. Each bucket is a small heap. pop()
+#walks the buckets from the current one and returns the first event that falls
+#inside the current year, so with a width close to the typical gap between
+#events both operations are O(1) on average. The bucket count doubles or halves
+#with the number of pending events and the width is re-estimated at each resize.
+class CalendarScheduler(EventScheduler):
+    MIN_BUCKETS = 16
+    def __init__(self, bucketWidth=1.0, bucketCount=64):
+        EventScheduler.__init__(self)
+        assert(bucketWidth > 0)
+        assert(bucketCount > 0)
+        self.__width = bucketWidth
+        self.__buckets = [[] for i in range(max(bucketCount, CalendarScheduler.MIN_BUCKETS))]
+        self.__size = 0
+        #Absolute slot number of the current bucket, time // width
+        self.__slot = 0
+        self.__lastTime = 0
+    def push(self, item):
+        time = item[0]
+        assert(time >= self.__lastTime)
+        slot = int(time / self.__width)
+        heappush(self.__buckets[slot % len(self.__buckets)], item)
+        self.__size += 1
+        if(self.__size > 2 * len(self.__buckets)):
+            self.__resize(2 * len(self.__buckets))
+    def pop(self):
+        (bucket, slot) = self.__find()
+        return self.__take(bucket, slot)
+    def peekTime(self):
+        (bucket, slot) = self.__find()
+        return bucket[0][0]
+    #Bucket holding the earliest event and its absolute slot number
+    def __find(self):
+        assert(self.__size > 0)
+        buckets = self.__buckets
+        count = len(buckets)
+        width = self.__width
+        slot = self.__slot
+        for i in range(count):
+            bucket = buckets[slot % count]
+            if(len(bucket) > 0 and int(bucket[0][0] / width) <= slot):
+                return (bucket, slot)
+            slot += 1
+        #Nothing in the coming year, jump straight to the earliest event
+        earliest = min(bucket[0] for bucket in buckets if len(bucket) > 0)
+        slot = int(earliest[0] / width)
+        return (buckets[slot % count], slot)
+    def __take(self, bucket, slot):
+        (time, seq, event) = heappop(bucket)
+        self.__slot = slot
+        self.__lastTime = time
+        self.__size -= 1
+        if(self.__size < len(self.__buckets) // 2 and len(self.__buckets) > CalendarScheduler.MIN_BUCKETS):
+            self.__resize(len(self.__buckets) // 2)
+        return (time, event)
+    def __resize(self, bucketCount):
+        items = [item for bucket in self.__buckets for item in bucket]
+        items.sort()
+        #Brown's estimate: three times the average gap between the next events
+        sample = [item[0] for item in items[:26]]
+        gaps = [b - a for (a, b) in zip(sample, sample[1:]) if b > a]
+        if(len(gaps) > 0):
+            self.__width = 3.0 * sum(gaps) / len(gaps)
+        self.__buckets = [[] for i in range(bucketCount)]
+        self.__slot = int(self.__lastTime / self.__width)
+        for item in items:
+            self.__buckets[int(item[0] / self.__width) % bucketCount].append(item)
+    def __len__(self):
+        return self.__size
+
+#Build the scheduler named by the EVENT_SCHEDULER parameter
+def createScheduler(kind='heap'):
+    if(kind == 'heap'):
+        return HeapScheduler()
+    elif(kind == 'calendar'):
+        return CalendarScheduler()
+    else:
+        raise Exception('Unknown scheduler: ' + str(kind))
@@ -0,0 +1,129 @@
+import math
+import bisect
+
+#Streaming quantiles of positive values with a bounded relative error, in the
+#manner of DDSketch (C. Masson, J. Rim and H. K. Lee, 2019). Values are counted
+#in logarithmic buckets [gamma^(i-1), gamma^i) with gamma = (1 + a) / (1 - a),
+#so every quantile is returned within a relative error a whatever order the
+#values come in; trip times grow as the evacuation goes on, which throws off
+#marker based sketches. Memory is at most maxBuckets counters: past that the
+#lowest buckets are merged, which only affects the smallest quantiles.
+class QuantileSketch:
+    def __init__(self, relativeAccuracy=0.01, maxBuckets=2048):
+        assert(0 < relativeAccuracy < 1)
+        self.relativeAccuracy = relativeAccuracy
+        self.gamma = (1 + relativeAccuracy) / (1 - relativeAccuracy)
+        self.logGamma = math.log(self.gamma)
+        self.maxBuckets = maxBuckets
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+    def add(self, x):
+        self.count += 1
+        if(x <= 0):
+            self.zeros += 1
+            return
+        key = int(math.ceil(math.log(x) / self.logGamma))
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+        if(len(self.buckets) > self.maxBuckets):
+            keys = sorted(self.buckets)
+            self.buckets[keys[1]] += self.buckets.pop(keys[0])
+    def quantile(self, q):
+        if(self.count == 0):
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if(rank < seen):
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if(rank < seen):
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+#Evacuation progress fed one exit at a time, in memory that does not grow with
+#the number of cars.
+#   milestones: the time the first ceil(X * cars) cars were out, for every
+#       fraction X and every quantile. Exits arrive in time order, so these
+#       are exact evacuation time quantiles and, with the default fractions
+#       1%, 2%, ..., 100%, a 100 point exit curve.
+#   trip time: time from leaving the parking lot to the exit, whose quantiles
+#       are estimated with a QuantileSketch, plus its mean, min and max.
+#   exits: per exit node the number of cars out, the first and last exit time
+#       and the throughput in between.
+class EvacuationStats:
+    def __init__(self, cars, quantiles=(0.5, 0.9, 0.99), fractions=None):
+        if(fractions is None):
+            fractions = [ndx / 100.0 for ndx in range(1, 101)]
+        self.cars = cars
+        self.quantiles = list(quantiles)
+        self.fractions = sorted(set(fractions) | set(self.quantiles))
+        self.__targets = [max(1, int(math.ceil(fraction * cars - 1e-9))) for fraction in self.fractions]
+        self.__next = 0
+        self.milestones = [None] * len(self.fractions)
+        self.count = 0
+        self.lastTime = None
+        self.tripSketch = QuantileSketch()
+        self.tripMean = 0.0
+        self.tripMin = float('inf')
+        self.tripMax = float('-inf')
+        self.exits = {}
+    def record(self, time, exitNode, tripTime):
+        self.count += 1
+        self.lastTime = time
+        targets = self.__targets
+        while(self.__next < len(targets) and self.count >= targets[self.__next]):
+            self.milestones[self.__next] = time
+            self.__next += 1
+        self.tripSketch.add(tripTime)
+        self.tripMean += (tripTime - self.tripMean) / self.count
+        self.tripMin = min(self.tripMin, tripTime)
+        self.tripMax = max(self.tripMax, tripTime)
+        record = self.exits.get(exitNode)
+        if(record is None):
+            self.exits[exitNode] = [1, time, time]
+        else:
+            record[0] += 1
+            record[2] = time
+    #Time the first fraction of the cars were out, None if that has not happened
+    #yet. Exact when the count is a milestone or the count out so far, else
+    #interpolated linearly in the count between the neighbouring points of the
+    #exit curve, the last exit included.
+    def timeTo(self, fraction):
+        if(not 0 < fraction <= 1):
+            raise Exception('Fraction of the cars out of (0, 1]: ' + str(fraction))
+        target = max(1, int(math.ceil(fraction * self.cars - 1e-9)))
+        if(self.count < target):
+            return None
+        (times, counts) = self.curve()
+        if(counts[-1] < self.count):
+            times.append(self.lastTime)
+            counts.append(self.count)
+        ndx = bisect.bisect_left(counts, target)
+        if(counts[ndx] == target):
+            return times[ndx]
+        return times[ndx - 1] + (times[ndx] - times[ndx - 1]) * (target - counts[ndx - 1]) / float(counts[ndx] - counts[ndx - 1])
+    #The milestones reached so far as an exit curve (times, exited counts)
+    def curve(self):
+        times = [0]
+        counts = [0]
+        for (target, time) in zip(self.__targets, self.milestones):
+            if(time is None):
+                break
+            if(target != counts[-1]):
+                times.append(time)
+                counts.append(target)
+        return (times, counts)
+    #Key metrics as a JSON friendly dictionary; ids maps exit node indices to ids
+    def report(self, ids=None):
+        exits = {}
+        for (node, (count, first, last)) in sorted(self.exits.items()):
+            key = str(ids[node] if ids is not None else node)
+            exits[key] = {'count': count, 'first': first, 'last': last, \
+                'throughput': count / (last - first) if last > first else None}
+        return {'cars': self.cars, 'exited': self.count, 'lastExit': self.lastTime, \
+            'timeTo': dict((str(fraction), self.timeTo(fraction)) for fraction in self.quantiles), \
+            'trip': {'mean': self.tripMean if self.count > 0 else None, 'min': self.tripMin if self.count > 0 else None, \
+                'max': self.tripMax if self.count > 0 else None, \
+                'quantiles': dict((str(q), self.tripSketch.quantile(q)) for q in self.quantiles)}, \
+            'exits': exits}
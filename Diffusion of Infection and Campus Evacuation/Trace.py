@@ -0,0 +1,45 @@
+import numpy as np
+
+#Occupancy trace written by the engine when VISUAL is on.
+#Every interval simulation time units it samples the car count and cop flag of
+#every node and the number of exited cars. The static layout of the network
+#(ids, end points, node types and the street connections) is saved along with
+#the samples so render.py can draw frames without rebuilding the world.
+class OccupancyTrace:
+    def __init__(self, network, interval):
+        assert(interval > 0)
+        self.network = network
+        self.interval = interval
+        self.nextTime = 0
+        self.__times = []
+        self.__exited = []
+        self.__counts = []
+        self.__cops = []
+    def sample(self, time, exited):
+        nodes = self.network.nodes
+        self.__times.append(time)
+        self.__exited.append(exited)
+        self.__counts.append(np.fromiter((node.carCount() for node in nodes), dtype=np.int32, count=len(nodes)))
+        self.__cops.append(np.fromiter((bool(node.cop) for node in nodes), dtype=bool, count=len(nodes)))
+        while(self.nextTime <= time):
+            self.nextTime += self.interval
+    def save(self, fileName):
+        network = self.network
+        nodes = network.nodes
+        edges = [(node.index, child.index) for node in nodes for child in node.children]
+        np.savez_compressed(fileName, \
+            times=np.array(self.__times, dtype=np.float64), \
+            exited=np.array(self.__exited, dtype=np.int64), \
+            counts=np.array(self.__counts, dtype=np.int32).reshape(len(self.__times), len(nodes)), \
+            cops=np.array(self.__cops, dtype=bool).reshape(len(self.__times), len(nodes)), \
+            ids=np.array([node.id for node in nodes], dtype=np.int64), \
+            start=np.array([node.start for node in nodes], dtype=np.float64), \
+            end=np.array([node.end for node in nodes], dtype=np.float64), \
+            isExit=network.isExit, \
+            isParking=network.isParking, \
+            edges=np.array(edges, dtype=np.int32).reshape(len(edges), 2))
+
+#Load a saved trace as a dictionary of arrays
+def loadTrace(fileName):
+    with np.load(fileName) as data:
+        return dict((key, data[key]) for key in data.files)
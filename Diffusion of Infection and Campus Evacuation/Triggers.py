@@ -0,0 +1,99 @@
+import heapq
+import parameters
+
+#Triggers fire an action once when an engine counter crosses a threshold.
+#A counter is 'exited' (cars out so far) or 'time' (simulation time); the
+#trigger fires on the first event after which the counter is greater than the
+#threshold, the same test the cop evacuation threshold always used. With
+#repeat set the trigger is rearmed at threshold + repeat, skipping ahead past
+#the current value, so it fires at most once per event.
+#Actions are callables taking (world, time). They are plain classes rather than
+#lambdas so a list of triggers can be sent to sweep workers.
+class Trigger:
+    COUNTERS = ('exited', 'time')
+    def __init__(self, counter, threshold, action, repeat=None):
+        if(counter not in Trigger.COUNTERS):
+            raise Exception('Unknown trigger counter: ' + str(counter))
+        assert(repeat is None or repeat > 0)
+        self.counter = counter
+        self.threshold = threshold
+        self.action = action
+        self.repeat = repeat
+        self.fired = 0
+    def __repr__(self):
+        return "Trigger " + self.counter + " > " + str(self.threshold) + " " + repr(self.action)
+
+#Triggers of a run, kept in one heap per counter ordered by threshold.
+#nextExited and nextTime are the lowest armed thresholds, so the engine only
+#compares two numbers per event and calls check when one of them is crossed.
+class TriggerSet:
+    def __init__(self, triggers=()):
+        self.__heaps = dict((counter, []) for counter in Trigger.COUNTERS)
+        self.__seq = 0
+        self.__fired = []
+        self.nextExited = float('inf')
+        self.nextTime = float('inf')
+        for trigger in triggers:
+            self.add(trigger)
+    def add(self, trigger):
+        heapq.heappush(self.__heaps[trigger.counter], (trigger.threshold, self.__seq, trigger))
+        self.__seq += 1
+        self.__refresh()
+    def __refresh(self):
+        exited = self.__heaps['exited']
+        time = self.__heaps['time']
+        self.nextExited = exited[0][0] if len(exited) > 0 else float('inf')
+        self.nextTime = time[0][0] if len(time) > 0 else float('inf')
+    #Reorder the armed triggers after their thresholds were changed
+    def rearm(self):
+        for heap in self.__heaps.values():
+            heap[:] = [(trigger.threshold, seq, trigger) for (threshold, seq, trigger) in heap]
+            heapq.heapify(heap)
+        self.__refresh()
+    #Fire every armed trigger whose counter is past its threshold
+    def check(self, world, exited, time):
+        for (counter, value) in (('exited', exited), ('time', time)):
+            heap = self.__heaps[counter]
+            while(len(heap) > 0 and value > heap[0][0]):
+                (threshold, seq, trigger) = heapq.heappop(heap)
+                trigger.action(world, time)
+                trigger.fired += 1
+                self.__fired.append(trigger)
+                if(trigger.repeat is not None):
+                    steps = int((value - threshold) // trigger.repeat) + 1
+                    trigger.threshold = threshold + steps * trigger.repeat
+                    heapq.heappush(heap, (trigger.threshold, seq, trigger))
+        self.__refresh()
+    #Undo the actions that changed process wide state, latest first
+    def restore(self):
+        for trigger in reversed(self.__fired):
+            if(hasattr(trigger.action, 'restore')):
+                trigger.action.restore()
+        self.__fired = []
+
+#Cops leave every intersection for the rest of the run
+class CopsLeave:
+    def __call__(self, world, time):
+        for node in world.nodes:
+            node.setCop(0)
+            node.setCopLeft(1)
+    def __repr__(self):
+        return "CopsLeave()"
+
+#Set a value in parameters.py, e.g. SetParameter('EAST_TENDENCY', 0.5) to
+#start a second evacuation phase. The old value is put back when the run ends.
+class SetParameter:
+    def __init__(self, name, value):
+        if(not hasattr(parameters, name)):
+            raise Exception('Unknown parameter: ' + name)
+        self.name = name
+        self.value = value
+        self.__old = []
+    def __call__(self, world, time):
+        self.__old.append(getattr(parameters, self.name))
+        setattr(parameters, self.name, self.value)
+    def restore(self):
+        if(len(self.__old) > 0):
+            setattr(parameters, self.name, self.__old.pop())
+    def __repr__(self):
+        return "SetParameter(" + repr(self.name) + ", " + repr(self.value) + ")"
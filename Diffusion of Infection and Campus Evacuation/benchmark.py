@@ -0,0 +1,71 @@
+import os
+import json
+import math
+import time
+import resource
+import argparse
+import tempfile
+from multiprocessing import Pool
+from networkgen import generate
+from sweep import setParameters, parseGridArgument
+
+#Scaling benchmark for simulator.py on generated networks.
+#Every size runs in a fresh worker process so its peak resident memory is its
+#own. Drivers route by time to exit by default (DRIVER_AWARENESS 1): on a big
+#grid a purely random walk takes too long to reach the exits to be worth timing.
+
+DEFAULT_PARAMETERS = {'DRIVER_AWARENESS': 1.0}
+
+#Worker: generate one network, run it once and measure it
+def runBenchmark(job):
+    (kind, cars, seed, directory, params) = job
+    import simulator
+    setParameters({'VISUAL': 0, 'DEBUG': 0, 'EXITS': []})
+    setParameters(params)
+    fileName = os.path.join(directory, kind + '-' + str(cars) + '.csv')
+    exits = max(4, int(math.sqrt(cars) / 10))
+    (intersections, streets, lots) = generate(kind, fileName, cars, exits=exits, seed=seed)
+    start = time.time()
+    (exitTimes, exitedCount) = simulator.simulate(fileName, seed=seed, output=False)
+    wall = time.time() - start
+    events = simulator.runStats['events']
+    return {'kind': kind, 'cars': cars, 'intersections': intersections, 'streets': streets, 'lots': lots, \
+        'exits': exits, 'events': events, 'wall': wall, 'eventsPerSecond': events / wall if wall > 0 else 0, \
+        'peakMB': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0, \
+        'exited': int(exitedCount[-1]), 'simulationTime': float(exitTimes[-1])}
+
+#Run kind networks of every size in sizes (cars), one after another
+def benchmark(kind='grid', sizes=(1000, 10000, 100000, 1000000), seed=0, params=None, directory=None):
+    if(params is None):
+        params = DEFAULT_PARAMETERS
+    if(directory is None):
+        directory = tempfile.mkdtemp(prefix='evacuation-benchmark-')
+    else:
+        os.makedirs(directory, exist_ok=True)
+    results = []
+    with Pool(1, maxtasksperchild=1) as pool:
+        for cars in sizes:
+            result = pool.apply(runBenchmark, ((kind, cars, seed, directory, params),))
+            results.append(result)
+            print(str(result['cars']).rjust(8) + " cars " + str(result['events']).rjust(11) + " events " \
+                + ("%.1f" % result['wall']).rjust(9) + " s " + ("%.0f" % result['eventsPerSecond']).rjust(8) \
+                + " events/s " + ("%.0f" % result['peakMB']).rjust(6) + " MB peak, " + str(result['exited']) + " out")
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scaling benchmark of the evacuation simulator on generated networks')
+    parser.add_argument('--kind', choices=['grid', 'radial', 'random'], default='grid')
+    parser.add_argument('--cars', type=int, nargs='+', default=[1000, 10000, 100000, 1000000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--param', action='append', default=[], help='NAME=value parameter for every run')
+    parser.add_argument('--dir', default=None, help='where to write the generated networks')
+    parser.add_argument('--json', default=None, help='also write the results to this file')
+    args = parser.parse_args()
+    params = dict(DEFAULT_PARAMETERS)
+    for argument in args.param:
+        (name, values) = parseGridArgument(argument)
+        params[name] = values[0]
+    results = benchmark(args.kind, args.cars, args.seed, params, args.dir)
+    if(args.json is not None):
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
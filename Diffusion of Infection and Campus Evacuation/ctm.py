@@ -0,0 +1,232 @@
+import argparse
+import numpy as np
+from scipy import sparse
+import parameters
+import simulator
+from sweep import expandGrid, parseGridArgument
+
+#Macroscopic cell-transmission engine for quick what-if answers.
+#The world is loaded with the same processInput/buildGraph as the car-level
+#simulator. Every street is cut into cells a car crosses in one time step at
+#AVERAGE_CAR_SPEED (its minTravelTime in steps), each holding an equal share of
+#the street capacity, which comes from AVERAGE_CAR_SPACE_LENGTH. A parking lot
+#is one cell holding its cars. Cars flow as a fluid: a cell sends
+#min(cars, CTM_SATURATION_FLOW) per step, a cell receives at most
+#min(CTM_SATURATION_FLOW, free space), and streets competing for the same
+#receiving cell share it in proportion to what they send. Exits are sinks.
+#Turning follows the car-level rules in expectation: the exit child when there
+#is one, otherwise the cop's least loaded child, the east tendency split or a
+#uniform split. ROUTING_POLICY 'exit' and DRIVER_AWARENESS are car-level only.
+#Many scenarios are run at once: the state is a cells x scenarios array, so a
+#step is the same handful of numpy and sparse operations for all of them.
+
+#Parameters a scenario may override in the cell-transmission engine
+SCENARIO_PARAMETERS = ['COP_MODE', 'COP_INTERSECTION_THRESHOLD', 'COP_CONGESTION_THRESHOLD', 'COP_EVACUATION_THRESHOLD', \
+    'EAST_TENDENCY', 'SPACE_TIME_TRADEOFF', 'DEAD_END', 'IF_MUTATE']
+
+#Compile the cells and links of network into a dictionary of arrays.
+#Cells are laid out node after node, cell C is the sink every exit drains into.
+#Links are the moves between neighbouring cells of a street followed by the
+#moves from the last cell of a node to the first cell of each of its children,
+#grouped by parent in children order.
+def buildCells(network, timeStep):
+    n = network.size
+    mtt = network.minTravelTime
+    lengths = np.where(network.isExit, 0, np.where(network.isParking, 1, np.maximum(1, np.rint(mtt / timeStep)))).astype(np.int64)
+    first = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    last = first + lengths - 1
+    C = int(lengths.sum())
+    cellNode = np.repeat(np.arange(n), lengths)
+    jam = np.append(network.capacity[cellNode] / lengths[cellNode], np.inf)
+    internal = np.nonzero(np.arange(C) != last[cellNode])[0]
+    edgeParent = []
+    edgeChild = []
+    for node in range(n):
+        if(network.isExit[node]):
+            continue
+        for child in network.children(node):
+            edgeParent.append(node)
+            edgeChild.append(int(child))
+    edgeParent = np.array(edgeParent, dtype=np.int64)
+    edgeChild = np.array(edgeChild, dtype=np.int64)
+    edgeTo = np.where(network.isExit[edgeChild], C, first[edgeChild])
+    linkFrom = np.concatenate((internal, last[edgeParent]))
+    linkTo = np.concatenate((internal + 1, edgeTo))
+    L = len(linkFrom)
+    ones = np.ones(L)
+    #Scatter matrices: (cells + 1) x links, summing link flows into cells
+    fromMatrix = sparse.csr_matrix((ones, (linkFrom, np.arange(L))), shape=(C + 1, L))
+    toMatrix = sparse.csr_matrix((ones, (linkTo, np.arange(L))), shape=(C + 1, L))
+    initial = np.zeros(C + 1)
+    initial[first[network.isParking]] = network.capacity[network.isParking]
+    groupStart = np.nonzero(np.concatenate(([True], edgeParent[1:] != edgeParent[:-1])))[0]
+    return {'network': network, 'timeStep': timeStep, 'cells': C, 'first': first, 'lengths': lengths, \
+        'jam': jam, 'internal': len(internal), 'edgeParent': edgeParent, 'edgeChild': edgeChild, \
+        'edgeGroup': np.cumsum(np.concatenate(([0], edgeParent[1:] != edgeParent[:-1]))), 'groupStart': groupStart, \
+        'linkFrom': linkFrom, 'linkTo': linkTo, 'fromMatrix': fromMatrix, 'toMatrix': toMatrix, 'initial': initial}
+
+#Values of SCENARIO_PARAMETERS for one scenario: parameters.py overridden by it
+def scenarioValues(scenario):
+    for name in scenario:
+        if(name in ('ROUTING_POLICY', 'DRIVER_AWARENESS')):
+            raise Exception(name + ' is not modelled by the cell-transmission engine')
+        if(name not in SCENARIO_PARAMETERS):
+            raise Exception('Unknown scenario parameter: ' + name)
+    return dict((name, scenario.get(name, getattr(parameters, name))) for name in SCENARIO_PARAMETERS)
+
+#Turning fractions of every parent to child link (edges x scenarios) when no
+#cop is directing traffic, and which parents can get a cop.
+def splitRatios(cells, values):
+    network = cells['network']
+    edgeParent = cells['edgeParent']
+    E = len(edgeParent)
+    B = len(values)
+    split = np.zeros((E, B))
+    copNode = np.zeros((network.size, B), dtype=bool)
+    starts = cells['groupStart']
+    ends = np.append(starts[1:], E)
+    for (start, end) in zip(starts, ends):
+        node = edgeParent[start]
+        m = end - start
+        exitNdx = network.exitChild[node]
+        if(exitNdx != -1):
+            split[start + exitNdx, :] = 1
+            continue
+        if(m == 1):
+            split[start, :] = 1
+            continue
+        east = network.eastChild[network.eastStart[node]:network.eastStart[node + 1]]
+        for (b, value) in enumerate(values):
+            tendency = value['EAST_TENDENCY']
+            split[start:end, b] = 1.0 / m
+            if(tendency != 0 and len(east) > 0):
+                #Chance that none of the east draws beats 1 - EAST_TENDENCY
+                stay = (1 - tendency) ** len(east)
+                split[start:end, b] = stay / m
+                split[start + east, b] += (1 - stay) / len(east)
+            copNode[node, b] = value['COP_MODE'] and m >= value['COP_INTERSECTION_THRESHOLD']
+    return (split, copNode)
+
+#Run every scenario (a dictionary of parameter overrides) on worldFile.
+#Returns one (exit times, exited counts) curve per scenario in the same form as
+#simulator.simulate: one row per car, the time the car's share of flow reached
+#an exit interpolated within the step, after a leading (0, 0).
+def simulateBatch(scenarios, worldFile='world.csv', timeStep=None, maxTime=None):
+    if(timeStep is None):
+        timeStep = parameters.CTM_TIME_STEP
+    if(maxTime is None):
+        maxTime = parameters.CTM_MAX_TIME
+    values = [scenarioValues(scenario) for scenario in scenarios]
+    B = len(values)
+    world = simulator.buildGraph(simulator.processInput(worldFile))
+    network = world.network
+    cells = buildCells(network, timeStep)
+    C = cells['cells']
+    (split, copNode) = splitRatios(cells, values)
+    flow = parameters.CTM_SATURATION_FLOW * timeStep
+    jam = cells['jam'][:, None]
+    linkFrom = cells['linkFrom']
+    linkTo = cells['linkTo']
+    fromMatrix = cells['fromMatrix']
+    toMatrix = cells['toMatrix']
+    internal = cells['internal']
+    edgeParent = cells['edgeParent']
+    edgeChild = cells['edgeChild']
+    edgeGroup = cells['edgeGroup']
+    groupStart = cells['groupStart']
+    total = cells['initial'].sum()
+    state = np.repeat(cells['initial'][:, None], B, axis=1)
+    linkSplit = np.concatenate((np.ones((internal, B)), split))
+
+    #Cop data, only used when some scenario has cops
+    useCops = copNode.any()
+    if(useCops):
+        occupied = np.nonzero(cells['lengths'] > 0)[0]
+        capacity = network.capacity.astype(np.float64)
+        tradeoff = np.array([value['SPACE_TIME_TRADEOFF'] for value in values])
+        travel = (network.minTravelTime / network.minTravelTime.max())[edgeChild][:, None]
+        congestionThreshold = np.array([value['COP_CONGESTION_THRESHOLD'] for value in values])
+        mutate = np.array([bool(value['IF_MUTATE']) for value in values])
+        deadEnd = np.array([[network.nodes[node].start in value['DEAD_END'] for value in values] for node in range(network.size)])
+    evacuationThreshold = np.array([value['COP_EVACUATION_THRESHOLD'] for value in values])
+    copLeft = np.zeros(B, dtype=bool)
+
+    times = [0.0]
+    exited = [np.zeros(B)]
+    time = 0.0
+    while(time < maxTime and (total - state[C]).max() >= 0.5):
+        send = np.minimum(state, flow)
+        receive = np.maximum(np.minimum(flow, jam - state), 0)
+        receive[C] = np.inf
+        ratio = linkSplit
+        if(useCops and not copLeft.all()):
+            counts = np.zeros((network.size, B))
+            counts[occupied] = np.add.reduceat(state[:C], cells['first'][occupied], axis=0)
+            decision = tradeoff * counts[edgeChild] / capacity[edgeChild][:, None] + (1 - tradeoff) * travel
+            #The cop sends everybody to the first child with the lowest score
+            best = np.minimum.reduceat(decision, groupStart, axis=0)[edgeGroup]
+            isBest = decision <= best
+            seen = np.cumsum(isBest, axis=0)
+            seenBefore = (seen - isBest)[groupStart][edgeGroup]
+            copSplit = (isBest & (seen - seenBefore == 1)).astype(np.float64)
+            cop = copNode & ~copLeft
+            if(mutate.any()):
+                congestion = counts / capacity[:, None]
+                cop &= ~mutate | (congestion >= congestionThreshold) | deadEnd
+            cop = cop[edgeParent]
+            ratio = linkSplit.copy()
+            ratio[internal:] = np.where(cop, copSplit, split)
+        demand = ratio * send[linkFrom]
+        wanted = toMatrix @ demand
+        scale = np.ones_like(wanted)
+        short = wanted > receive
+        scale[short] = receive[short] / wanted[short]
+        moved = demand * scale[linkTo]
+        state += toMatrix @ moved - fromMatrix @ moved
+        time += timeStep
+        times.append(time)
+        exited.append(state[C].copy())
+        copLeft |= state[C] > evacuationThreshold
+    return [carCurve(np.array(times), np.array([step[b] for step in exited])) for b in range(B)]
+
+#Turn a cumulative exit flow sampled at times into the per-car exit curve.
+#Car k is out once the cumulative flow reaches k - 0.5.
+def carCurve(times, cumulative):
+    cars = np.arange(1, int(np.floor(cumulative[-1] + 0.5)) + 1, dtype=np.float64)
+    targets = cars - 0.5
+    ndx = np.maximum(np.searchsorted(cumulative, targets, side='left'), 1)
+    before = cumulative[ndx - 1]
+    step = np.maximum(cumulative[ndx] - before, 1e-12)
+    exitTimes = times[ndx - 1] + np.clip((targets - before) / step, 0, 1) * (times[ndx] - times[ndx - 1])
+    return (np.concatenate(([0], exitTimes)), np.concatenate(([0], cars.astype(np.int64))))
+
+#Single scenario with the values in parameters.py, like simulator.simulate
+def simulate(worldFile='world.csv', timeStep=None, maxTime=None):
+    return simulateBatch([{}], worldFile, timeStep, maxTime)[0]
+
+#Screen a grid of scenarios: time for half and for all of the cars to get out,
+#inf when that many were not out by maxTime, and how many got out. Half and all
+#count every car of the world, so a scenario that is still clearing at maxTime
+#never looks quicker than one that cleared.
+def screen(grid, worldFile='world.csv', timeStep=None, maxTime=None):
+    scenarios = expandGrid(grid)
+    curves = simulateBatch(scenarios, worldFile, timeStep, maxTime)
+    cars = simulator.buildGraph(simulator.processInput(worldFile)).population
+    results = []
+    for (scenario, (exitTimes, exitedCount)) in zip(scenarios, curves):
+        count = int(exitedCount[-1])
+        halfCars = int(np.ceil(cars / 2.0))
+        half = float(exitTimes[halfCars]) if count >= halfCars else float('inf')
+        last = float(exitTimes[-1]) if count >= cars else float('inf')
+        results.append((scenario, half, last, count))
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cell-transmission screening of evacuation scenarios')
+    parser.add_argument('--param', action='append', default=[], help='NAME=v1,v2,... grid values for a parameter')
+    parser.add_argument('--world', default='world.csv')
+    parser.add_argument('--step', type=float, default=None)
+    args = parser.parse_args()
+    grid = dict(parseGridArgument(argument) for argument in args.param)
+    for (scenario, half, last, count) in sorted(screen(grid, args.world, args.step), key=lambda result: result[2]):
+        print(str(scenario) + " half out " + str(round(half, 1)) + " all out " + str(round(last, 1)) + " cars out " + str(count))
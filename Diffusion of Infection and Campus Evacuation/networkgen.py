@@ -0,0 +1,148 @@
+import csv
+import math
+import argparse
+import numpy as np
+from scipy.spatial import Delaunay
+
+#Synthetic road networks in the world.csv schema (Type,X1,Y1,X2,Y2,Capacity,Comment)
+#for trying the simulator on campuses bigger than Georgia Tech.
+#A network is a set of integer intersections joined by streets. Streets are
+#written once and buildGraph adds the way back; exits are one-way streets
+#leading out of the network with the comment 'Exit', which buildGraph treats as
+#evacuation destinations. Parking lots sit next to an intersection and drive
+#onto it. Coordinates are in the same units as world.csv (UNIT_LENGTH ft), so
+#the default spacing of 50 gives 350 ft blocks.
+
+HEADER = ['Type', 'X1', 'Y1', 'X2', 'Y2', 'Capacity', 'Comment']
+EXIT_COMMENT = 'Exit'
+
+#rows x cols lattice of intersections
+def gridNetwork(rows, cols, spacing=50):
+    points = np.array([(x * spacing, y * spacing) for y in range(rows) for x in range(cols)], dtype=np.int64)
+    edges = []
+    for y in range(rows):
+        for x in range(cols):
+            ndx = y * cols + x
+            if(x + 1 < cols):
+                edges.append((ndx, ndx + 1))
+            if(y + 1 < rows):
+                edges.append((ndx, ndx + cols))
+    return (points, edges)
+
+#A center joined by spokes to rings spacing apart, every ring a loop
+def radialNetwork(rings, spokes, spacing=50):
+    radius = rings * spacing
+    points = [(radius, radius)]
+    edges = []
+    for ring in range(1, rings + 1):
+        for spoke in range(spokes):
+            angle = 2 * math.pi * spoke / spokes
+            points.append((int(round(radius + ring * spacing * math.cos(angle))), int(round(radius + ring * spacing * math.sin(angle)))))
+            ndx = len(points) - 1
+            edges.append((0 if ring == 1 else ndx - spokes, ndx))
+            edges.append((ndx, ndx + 1 if spoke + 1 < spokes else ndx + 1 - spokes))
+    return (np.array(points, dtype=np.int64), edges)
+
+#About count intersections jittered around a square lattice and joined by their
+#Delaunay triangulation, so streets never cross
+def randomPlanarNetwork(count, spacing=50, rng=None):
+    if(rng is None):
+        rng = np.random.default_rng()
+    side = int(math.ceil(math.sqrt(count)))
+    lattice = np.array([(x, y) for y in range(side) for x in range(side)], dtype=np.float64)[:count] * spacing
+    points = np.rint(lattice + rng.uniform(-spacing / 3.0, spacing / 3.0, size=lattice.shape)).astype(np.int64)
+    edges = set()
+    for simplex in Delaunay(points).simplices:
+        for (i, j) in ((0, 1), (1, 2), (0, 2)):
+            edges.add((min(simplex[i], simplex[j]), max(simplex[i], simplex[j])))
+    return (points, sorted((int(i), int(j)) for (i, j) in edges))
+
+#exits outermost intersections at evenly spread bearings from the centroid,
+#each with a street of length spacing pointing away from the centroid
+def placeExits(points, exits, spacing=50):
+    center = points.mean(axis=0)
+    chosen = []
+    for ndx in range(exits):
+        angle = 2 * math.pi * ndx / exits
+        direction = np.array([math.cos(angle), math.sin(angle)])
+        order = np.argsort(-(points - center).dot(direction), kind='stable')
+        point = next(int(p) for p in order if int(p) not in chosen)
+        chosen.append(point)
+    streets = []
+    for point in chosen:
+        away = points[point] - center
+        norm = np.hypot(away[0], away[1])
+        away = away / norm if norm > 0 else np.array([1.0, 0.0])
+        end = np.rint(points[point] + away * spacing).astype(np.int64)
+        streets.append((tuple(points[point]), tuple(end)))
+    return streets
+
+#cars spread over lots parking lots at distinct random intersections
+def placeParking(points, cars, lots, rng=None):
+    if(rng is None):
+        rng = np.random.default_rng()
+    lots = max(1, min(lots, cars, len(points)))
+    chosen = rng.choice(len(points), size=lots, replace=False)
+    (share, extra) = divmod(cars, lots)
+    parkings = []
+    for (ndx, point) in enumerate(chosen):
+        (x, y) = points[point]
+        parkings.append(((int(x) + 2, int(y) + 1), (int(x), int(y)), share + (1 if ndx < extra else 0)))
+    return parkings
+
+def writeWorld(fileName, points, edges, exits, parkings, lanes=2):
+    with open(fileName, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(HEADER)
+        for (i, j) in edges:
+            w.writerow(['Street', int(points[i][0]), int(points[i][1]), int(points[j][0]), int(points[j][1]), lanes, ''])
+        for (start, end) in exits:
+            w.writerow(['Street', int(start[0]), int(start[1]), int(end[0]), int(end[1]), lanes, EXIT_COMMENT])
+        for (start, end, capacity) in parkings:
+            w.writerow(['Parking', start[0], start[1], end[0], end[1], capacity, ''])
+
+#Write a kind ('grid', 'radial' or 'random') network for cars cars to fileName.
+#size is the grid side, the number of rings or the number of intersections and
+#is picked from cars when not given, about one intersection per 20 cars; lots
+#defaults to a quarter of the intersections. Returns (intersections, streets, lots).
+def generate(kind, fileName, cars, lots=None, exits=4, size=None, spacing=50, lanes=2, seed=None):
+    rng = np.random.default_rng(seed)
+    intersections = max(4, int(math.ceil(cars / 20.0)))
+    if(kind == 'grid'):
+        if(size is None):
+            size = int(math.ceil(math.sqrt(intersections)))
+        (points, edges) = gridNetwork(size, size, spacing)
+    elif(kind == 'radial'):
+        spokes = 16
+        if(size is None):
+            size = int(math.ceil(intersections / float(spokes)))
+        (points, edges) = radialNetwork(size, spokes, spacing)
+    elif(kind == 'random'):
+        if(size is None):
+            size = intersections
+        (points, edges) = randomPlanarNetwork(size, spacing, rng)
+    else:
+        raise Exception('Unknown network kind: ' + str(kind))
+    if(lots is None):
+        lots = max(1, len(points) // 4)
+    exitStreets = placeExits(points, exits, spacing)
+    parkings = placeParking(points, cars, lots, rng)
+    writeWorld(fileName, points, edges, exitStreets, parkings, lanes)
+    return (len(points), len(edges) + len(exitStreets), len(parkings))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic road network in the world.csv schema')
+    parser.add_argument('kind', choices=['grid', 'radial', 'random'])
+    parser.add_argument('output')
+    parser.add_argument('--cars', type=int, default=10000)
+    parser.add_argument('--lots', type=int, default=None)
+    parser.add_argument('--exits', type=int, default=4)
+    parser.add_argument('--size', type=int, default=None)
+    parser.add_argument('--spacing', type=int, default=50)
+    parser.add_argument('--lanes', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    (intersections, streets, lots) = generate(args.kind, args.output, args.cars, args.lots, args.exits, args.size, \
+        args.spacing, args.lanes, args.seed)
+    print("Wrote " + args.output + ": " + str(intersections) + " intersections, " + str(streets) + " streets, " \
+        + str(lots) + " parking lots")
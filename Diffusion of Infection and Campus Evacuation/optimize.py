@@ -0,0 +1,152 @@
+import os
+import math
+import argparse
+import numpy as np
+from multiprocessing import Pool
+import parameters
+from sweep import expandGrid, setParameters, parseGridArgument, CURRENT_DIRECTORY
+
+#Successive halving over evacuation policies.
+#Every configuration starts running up to a short simulation horizon. They are
+#ranked on their partial exit curves, the best 1/eta go on and the horizon
+#grows eta times, until one is left. A survivor does not replay its prefix:
+#it resumes from the checkpoint it stopped at (see simulator.saveCheckpoint).
+#All configurations use the same seeds, so they are raced on the same random
+#numbers. The objective is the time until fraction of the cars are out; a run
+#that has not got there yet ranks behind every one that has, by cars out.
+
+#Random configurations from space: NAME -> list of choices, or (low, high)
+#for a uniform value
+def sampleConfigurations(space, count, seed=None):
+    rng = np.random.default_rng(seed)
+    configs = []
+    for i in range(count):
+        config = {}
+        for (name, values) in sorted(space.items()):
+            if(not hasattr(parameters, name)):
+                raise Exception('Unknown parameter: ' + name)
+            if(isinstance(values, tuple)):
+                config[name] = float(rng.uniform(values[0], values[1]))
+            else:
+                config[name] = values[int(rng.integers(len(values)))]
+        configs.append(config)
+    return configs
+
+#Worker: start or resume one replica of one configuration and run it up to
+#untilTime (to the end when None)
+def runRung(job):
+    (configNdx, replica, params, seed, checkpoint, untilTime, fraction, worldFile) = job
+    import simulator
+    if(checkpoint is None):
+        setParameters({'VISUAL': 0, 'DEBUG': 0, 'INSTRUMENT': 0, 'KEEP_EXIT_CURVE': 0})
+        setParameters(params)
+        run = simulator.startRun(worldFile, seed)
+    else:
+        run = simulator.loadCheckpoint(checkpoint)
+    before = run['events']
+    finished = simulator.advance(run, untilTime=untilTime)
+    result = {'config': configNdx, 'replica': replica, 'finished': finished, 'time': run['time'], \
+        'exited': run['exited'], 'timeTo': run['stats'].timeTo(fraction), 'events': run['events'] - before}
+    if(finished):
+        result['stats'] = simulator.runReport(run)
+        result['checkpoint'] = None
+    else:
+        result['checkpoint'] = simulator.saveCheckpoint(run)
+    return result
+
+#Ranking key of a configuration from the latest result of each replica
+def score(results):
+    if(any(result['timeTo'] is None for result in results)):
+        return (float('inf'), -np.mean([result['exited'] for result in results]))
+    return (np.mean([result['timeTo'] for result in results]), 0)
+
+#Race configs (dictionaries of parameter values, on top of fixed) with
+#successive halving. firstHorizon is the simulation time of the first rung and
+#maxTime caps the last one. Returns one record per configuration, best first:
+#its parameters, the rung it reached, its score and its latest results.
+def successiveHalving(configs, fixed=None, replicas=1, eta=3, firstHorizon=1000, fraction=0.9, maxTime=None, \
+    processes=None, seed=None, worldFile=None):
+    assert(eta > 1)
+    assert(replicas > 0)
+    if(worldFile is None):
+        worldFile = os.path.join(CURRENT_DIRECTORY, 'world.csv')
+    configs = [dict(fixed or {}, **config) for config in configs]
+    seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(replicas)]
+    latest = dict(((configNdx, replica), None) for configNdx in range(len(configs)) for replica in range(replicas))
+    reached = [0] * len(configs)
+    alive = list(range(len(configs)))
+    horizon = firstHorizon
+    rung = 0
+    events = 0
+    with Pool(processes) as pool:
+        while(True):
+            last = len(alive) == 1 or (maxTime is not None and horizon >= maxTime)
+            untilTime = maxTime if last else horizon
+            jobs = []
+            for configNdx in alive:
+                for replica in range(replicas):
+                    result = latest[(configNdx, replica)]
+                    if(result is not None and result['finished']):
+                        continue
+                    checkpoint = None if result is None else result['checkpoint']
+                    jobs.append((configNdx, replica, configs[configNdx], seeds[replica], checkpoint, untilTime, fraction, worldFile))
+            for result in pool.imap_unordered(runRung, jobs):
+                latest[(result['config'], result['replica'])] = result
+                events += result['events']
+            for configNdx in alive:
+                reached[configNdx] = rung
+            ranked = sorted(alive, key=lambda configNdx: score([latest[(configNdx, replica)] for replica in range(replicas)]))
+            if parameters.DEBUG:
+                best = configs[ranked[0]]
+                print("Rung " + str(rung) + " horizon " + str(untilTime) + ": " + str(len(alive)) + " alive, best " + str(best))
+            if(last):
+                break
+            #Checkpoints of the configurations dropped are not needed any more
+            keep = max(1, int(math.ceil(len(alive) / float(eta))))
+            for configNdx in ranked[keep:]:
+                for replica in range(replicas):
+                    latest[(configNdx, replica)]['checkpoint'] = None
+            alive = ranked[:keep]
+            horizon *= eta
+            rung += 1
+    records = []
+    for configNdx in range(len(configs)):
+        results = [latest[(configNdx, replica)] for replica in range(replicas)]
+        for result in results:
+            result.pop('checkpoint', None)
+        records.append({'params': configs[configNdx], 'rung': reached[configNdx], 'score': score(results), 'results': results})
+    records.sort(key=lambda record: (-record['rung'], record['score']))
+    if parameters.DEBUG:
+        print("Simulated " + str(events) + " events in total")
+    return records
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Successive halving search over evacuation policies')
+    parser.add_argument('--param', action='append', default=[], help='NAME=v1,v2,... values to search over (full grid)')
+    parser.add_argument('--range', action='append', default=[], help='NAME=low:high uniform values, with --samples')
+    parser.add_argument('--samples', type=int, default=27, help='configurations drawn when --range is given')
+    parser.add_argument('--set', action='append', default=[], help='NAME=value fixed for every configuration')
+    parser.add_argument('--replicas', type=int, default=1)
+    parser.add_argument('--eta', type=int, default=3)
+    parser.add_argument('--horizon', type=float, default=1000, help='simulation time of the first rung')
+    parser.add_argument('--max-time', type=float, default=None)
+    parser.add_argument('--fraction', type=float, default=0.9, help='minimize the time until this fraction is out')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--world', default=None)
+    args = parser.parse_args()
+    fixed = dict((name, values[0]) for (name, values) in (parseGridArgument(argument) for argument in args.set))
+    if(len(args.range) > 0):
+        space = dict(parseGridArgument(argument) for argument in args.param)
+        for argument in args.range:
+            (name, bounds) = argument.split('=', 1)
+            (low, high) = bounds.split(':')
+            space[name] = (float(low), float(high))
+        configs = sampleConfigurations(space, args.samples, args.seed)
+    else:
+        configs = expandGrid(dict(parseGridArgument(argument) for argument in args.param))
+    records = successiveHalving(configs, fixed, args.replicas, args.eta, args.horizon, args.fraction, args.max_time, \
+        args.processes, args.seed, args.world)
+    for record in records[:10]:
+        print(str(record['params']) + " rung " + str(record['rung']) + " score " + str(record['score'][0]) \
+            + " out " + str(np.mean([result['exited'] for result in record['results']])))
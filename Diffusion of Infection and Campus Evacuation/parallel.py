@@ -0,0 +1,447 @@
+import os
+import argparse
+import numpy as np
+from multiprocessing import Process, Pipe
+import parameters
+from Objects import Node, Event, handleOnStreet, wakeCar, blockingStats, resetBlockingStats
+from Triggers import Trigger, TriggerSet, CopsLeave
+from RandomStreams import RandomStreams
+from Statistics import EvacuationStats
+from sweep import setParameters, parseGridArgument, CURRENT_DIRECTORY
+import simulator
+
+#Conservative parallel execution of one evacuation.
+#The nodes are split into partitions, one worker process each, and every worker
+#runs the usual handlers on the nodes it owns. A street whose end feeds a street
+#of another partition is a boundary link. A car driven onto it leaves as a
+#message stamped with the time it reaches the end of the street, which is at
+#least the upstream street's minTravelTime later: the link's lookahead.
+#Capacity cannot be read across partitions, so the owner of a boundary street
+#lends every upstream link an even share of its slots up front. Upstream sees
+#the street as a RemoteStreet holding those credits: a car spends one to get on
+#and the slot is handed back PARALLEL_CREDIT_DELAY after the car drives off the
+#street. The delay stands for the one time unit a woken car waits before it
+#retries, and is the lookahead of the way back. A link that runs dry with cars
+#waiting asks for more slots and returns them once no one waits for them, so
+#the slots of a street follow the traffic instead of staying split evenly.
+#Workers advance in lock step over windows as long as the smallest lookahead,
+#so no message can land inside the window it was sent in. The coordinator skips
+#empty stretches, hands the messages over between windows and merges the exits
+#in time order. Every partition has its own random streams, so a run matches
+#the sequential engine in distribution, not event for event. The cops leave
+#once the exits counted up to the start of the window pass the threshold.
+
+KIND_CAR = 0
+KIND_CREDIT = 1
+KIND_REQUEST = 2
+KIND_GRANT = 3
+KIND_RELEASE = 4
+
+#Size of the last parallel run, see simulate,
+#and the events of every partition, whose largest share bounds the speedup
+parallelStats = {'events': 0, 'windows': 0, 'messages': 0, 'cars': 0, 'simulationTime': 0, 'partitions': 0, \
+    'partitionEvents': []}
+
+#Recursive coordinate bisection: split the nodes at the weighted median of their
+#midpoints along the longer side of their bounding box until there are parts
+#groups of about the same weight. A node weighs its capacity, so a parking lot
+#counts as many times as the cars starting in it. Returns the partition of
+#every node.
+def partitionNetwork(network, parts):
+    assert(parts >= 1)
+    points = np.array([((node.start[0] + node.end[0]) / 2.0, (node.start[1] + node.end[1]) / 2.0) \
+        for node in network.nodes], dtype=np.float64).reshape(-1, 2)
+    weights = np.where(network.isExit, 1, network.capacity).astype(np.float64)
+    owner = np.zeros(network.size, dtype=np.int32)
+    stack = [(np.arange(network.size), 0, parts)]
+    while(len(stack) > 0):
+        (indices, first, count) = stack.pop()
+        if(count == 1 or len(indices) == 0):
+            owner[indices] = first
+            continue
+        left = count // 2
+        span = points[indices].max(axis=0) - points[indices].min(axis=0)
+        axis = int(np.argmax(span))
+        order = indices[np.argsort(points[indices, axis], kind='stable')]
+        cumulative = np.cumsum(weights[order])
+        cut = int(np.searchsorted(cumulative, cumulative[-1] * left / float(count)))
+        stack.append((order[:cut], first, left))
+        stack.append((order[cut:], first + left, count - left))
+    return owner
+
+#(parent, child) node indices of every street feeding a street of another
+#partition, in a stable order; a link is a position in this list. Exits are
+#sinks, every partition keeps its own.
+def boundaryLinks(network, owner):
+    links = []
+    for node in network.nodes:
+        for child in node.children:
+            if(not child.exit and owner[child.index] != owner[node.index]):
+                links.append((node.index, child.index))
+    return links
+
+#Slots lent to every link: each street of the network entering the child gets an
+#even share of its capacity, at least one
+def creditGrants(network, links):
+    parents = np.bincount(network.childIndex, minlength=network.size)
+    return [max(1, int(network.capacity[child] // parents[child])) for (parent, child) in links]
+
+#Smallest lookahead of any boundary link, the width of a window
+def lookahead(network, links):
+    if(len(links) == 0):
+        return float('inf')
+    return min([parameters.PARALLEL_CREDIT_DELAY] + [float(network.minTravelTime[parent]) for (parent, child) in links])
+
+#Upstream stand-in for a street owned by another partition. Its capacity is the
+#share of the street's slots the link holds, base of them for good, and credits
+#the ones not in use, so the handlers and the routing treat it like a street
+#with that many free slots. A car blocked on it with no credits left puts it on
+#the partition's starved list, once until the owner answers.
+class RemoteStreet:
+    remote = True
+    lent = False
+    exit = False
+    type = Node.TYPE_STREET
+    def __init__(self, node, link, credits, starved):
+        self.index = node.index
+        self.id = node.id
+        self.start = node.start
+        self.end = node.end
+        self.comment = node.comment
+        self.minTravelTime = node.minTravelTime
+        self.maxMinTravelTimeforAll = node.maxMinTravelTimeforAll
+        self.direction = node.direction
+        self.link = link
+        self.base = credits
+        self.capacity = credits
+        self.credits = credits
+        self.requested = False
+        self.__starved = starved
+        self.__waiters = []
+    def enterCar(self, car):
+        assert(self.credits > 0)
+        self.credits -= 1
+        return 0
+    def carCount(self):
+        return self.capacity - self.credits
+    def canEnterCar(self):
+        return self.credits > 0
+    def canEnterCarOnStreet(self):
+        return self.credits > 0
+    def addWaiter(self, car, token):
+        self.__waiters.append((car, token))
+        if(self.credits == 0 and not self.requested):
+            self.requested = True
+            self.__starved.append(self)
+    def popWaiters(self):
+        waiters = self.__waiters
+        self.__waiters = []
+        return waiters
+
+#The boundary state of one worker's world: the RemoteStreets it sends cars to,
+#the streets it lent slots of, the link every borrowed car came in by, the
+#requests for slots it could not serve yet and the messages waiting to go out as
+#(destination partition, message). A message is (time, kind, link, car id, entry
+#time); messages other than cars are kept under a key until they are handled.
+#Slots move between the two sides of a link like this:
+#   credit: a borrowed car drove off the lent street, its slot is free again
+#   request: a RemoteStreet ran out of credits with cars waiting on it
+#   grant: the owner lends one more slot, taken from the street's free ones
+#   release: a slot beyond the link's base share came back while no one was
+#       waiting for it, the owner gets it back
+class Partition:
+    def __init__(self, world, owner, part):
+        network = world.network
+        self.world = world
+        self.owner = owner
+        self.part = part
+        self.links = boundaryLinks(network, owner)
+        self.streets = {}
+        self.lentStreets = {}
+        self.origin = {}
+        self.pending = {}
+        self.starved = []
+        self.mail = {}
+        self.mailKey = 0
+        self.outbox = []
+        self.events = 0
+        lent = {}
+        for (link, ((parent, child), credits)) in enumerate(zip(self.links, creditGrants(network, self.links))):
+            if(owner[parent] == part):
+                street = RemoteStreet(network.nodes[child], link, credits, self.starved)
+                node = network.nodes[parent]
+                node.children = tuple(street if other.index == child else other for other in node.children)
+                self.streets[link] = street
+            elif(owner[child] == part):
+                self.lentStreets[link] = network.nodes[child]
+                lent[child] = lent.get(child, 0) + credits
+        #Lent slots count as taken; the owner keeps at least one
+        for (child, credits) in lent.items():
+            node = network.nodes[child]
+            node.lent = True
+            node.capacity = max(1, node.capacity - credits)
+        world.partition = self
+
+    #Queue a message about link for the other side of it
+    def post(self, time, kind, link, upstream):
+        (parent, child) = self.links[link]
+        destination = self.owner[parent] if upstream else self.owner[child]
+        self.outbox.append((int(destination), (time, kind, link, 0, 0.0)))
+
+    #Called by moveCar: car got on a street of another partition, reaching its end
+    #at time. It goes on over there, its handle here is freed.
+    def send(self, world, car, street, time):
+        (parent, child) = self.links[street.link]
+        cars = world.cars
+        self.outbox.append((int(self.owner[child]), (time, KIND_CAR, street.link, int(cars.id[car]), float(cars.entryTime[car]))))
+        cars.release(car)
+
+    #Called when car drives off a lent street: a borrowed slot goes back
+    #upstream, a slot of the owner's may go to a link waiting for one
+    def leave(self, world, car, node, time):
+        link = self.origin.pop(car, None)
+        if(link is not None):
+            node.capacity -= 1
+            self.post(time + parameters.PARALLEL_CREDIT_DELAY, KIND_CREDIT, link, True)
+        if(node.index in self.pending):
+            self.grant(node, time)
+
+    #Lend free slots of node to the links waiting for one, keeping one
+    def grant(self, node, time):
+        waiting = self.pending[node.index]
+        while(len(waiting) > 0 and node.carCount() < node.capacity and node.capacity > 1):
+            node.capacity -= 1
+            self.post(time + parameters.PARALLEL_CREDIT_DELAY, KIND_GRANT, waiting.pop(0), True)
+        if(len(waiting) == 0):
+            del self.pending[node.index]
+
+    #Schedule the messages of the coming window
+    def deliver(self, inbox):
+        world = self.world
+        cars = world.cars
+        for (time, kind, link, id, entryTime) in inbox:
+            if(kind == KIND_CAR):
+                car = cars.add(id)
+                cars.entryTime[car] = entryTime
+                self.origin[car] = link
+                world.events.schedule(time, car, Event.TYPE_ARRIVAL)
+            else:
+                self.mail[self.mailKey] = (kind, link)
+                world.events.schedule(time, self.mailKey, Event.TYPE_MESSAGE)
+                self.mailKey += 1
+
+    #A car from upstream takes its borrowed slot at the back of the street and
+    #is at the end of it
+    def arrive(self, world, event, time):
+        car = event.car
+        node = self.lentStreets[self.origin[car]]
+        node.capacity += 1
+        world.cars.enter(car, node)
+        if(world.routing is not None):
+            world.routing.update(node)
+        handleOnStreet(world, event, time)
+
+    def receive(self, world, key, time):
+        (kind, link) = self.mail.pop(key)
+        if(kind == KIND_CREDIT):
+            self.slotBack(world, self.streets[link], time)
+        elif(kind == KIND_GRANT):
+            street = self.streets[link]
+            street.capacity += 1
+            street.requested = False
+            self.slotBack(world, street, time)
+        elif(kind == KIND_REQUEST):
+            node = self.lentStreets[link]
+            self.pending.setdefault(node.index, []).append(link)
+            self.grant(node, time)
+        elif(kind == KIND_RELEASE):
+            node = self.lentStreets[link]
+            node.capacity += 1
+            if(node.index in self.pending):
+                self.grant(node, time)
+            for (car, token) in node.popWaiters():
+                if(world.cars.waitToken[car] == token):
+                    wakeCar(world, car, time)
+        else:
+            raise Exception('Unknown message kind: ' + str(kind))
+
+    #A slot of street came back. The delay already covered the headway of a
+    #woken car, so the cars waiting for it retry right away. A slot beyond the
+    #base share no one is waiting for is released.
+    def slotBack(self, world, street, time):
+        cars = world.cars
+        waiters = [(car, token) for (car, token) in street.popWaiters() if cars.waitToken[car] == token]
+        if(len(waiters) == 0 and street.capacity > street.base):
+            street.capacity -= 1
+            self.post(time + parameters.PARALLEL_CREDIT_DELAY, KIND_RELEASE, street.link, False)
+            return
+        street.credits += 1
+        if(world.routing is not None):
+            world.routing.update(street)
+        for (car, token) in waiters:
+            wakeCar(world, car, time - 1)
+
+    #Handle the events before end. exited is the number of cars out in all
+    #partitions at the start of the window. Returns the exits of the window as
+    #(time, exit node, trip time).
+    def run(self, end, exited):
+        world = self.world
+        events = world.events
+        cars = world.cars
+        triggerSet = world.triggers
+        exits = []
+        while(len(events) > 0 and events.peekTime() < end):
+            (time, event) = events.pop()
+            event.eventHandler(world, event, time)
+            if(event.type == Event.TYPE_EXIT):
+                car = event.car
+                exits.append((time, int(cars.node[car]), time - float(cars.entryTime[car])))
+                cars.release(car)
+            if(exited + len(exits) > triggerSet.nextExited or time > triggerSet.nextTime):
+                triggerSet.check(world, exited + len(exits), time)
+            events.release(event)
+            self.events += 1
+        for street in self.starved:
+            self.post(end, KIND_REQUEST, street.link, False)
+        del self.starved[:]
+        return exits
+
+    def nextTime(self):
+        return self.world.events.peekTime() if len(self.world.events) > 0 else float('inf')
+
+    def takeOutbox(self):
+        outbox = self.outbox
+        self.outbox = []
+        return outbox
+
+#Worker process: build the world, keep the cars of the lots part owns and
+#answer the coordinator's windows until it says stop
+def partitionWorker(connection, worldFile, owner, part, seed, params):
+    setParameters(params)
+    resetBlockingStats()
+    random = RandomStreams(seed, parameters.RANDOM_BLOCK_SIZE)
+    rows = simulator.processInput(worldFile)
+    parkingLots = set(int(ndx) for ndx in np.nonzero(np.asarray(owner) == part)[0])
+    world = simulator.buildGraph(rows, random, parkingLots)
+    world.triggers = TriggerSet([Trigger('exited', parameters.COP_EVACUATION_THRESHOLD, CopsLeave())])
+    partition = Partition(world, owner, part)
+    connection.send((world.population, partition.nextTime()))
+    while(True):
+        message = connection.recv()
+        if(message[0] == 'stop'):
+            break
+        (command, end, exited, inbox) = message
+        partition.deliver(inbox)
+        exits = partition.run(end, exited)
+        connection.send((partition.takeOutbox(), exits, partition.nextTime()))
+    connection.send({'events': partition.events, 'blocking': dict(blockingStats)})
+    connection.close()
+
+#Run one evacuation of worldFile over partitions worker processes and return
+#the exit curve as (exit times, exited counts), like simulator.simulate. The
+#partitions' seeds are spawned from seed. output writes the curve to ./data and
+#store, a ResultStore, gets the run.
+def simulate(worldFile='world.csv', seed=None, partitions=2, output=True, store=None):
+    assert(partitions >= 1)
+    network = simulator.buildGraph(simulator.processInput(worldFile), parkingLots=set()).network
+    owner = partitionNetwork(network, partitions)
+    links = boundaryLinks(network, owner)
+    window = lookahead(network, links)
+    assert(window > 0)
+    seedSequence = np.random.SeedSequence(seed)
+    seeds = [int(child.generate_state(1)[0]) for child in seedSequence.spawn(partitions)]
+    params = dict((name, getattr(parameters, name)) for name in dir(parameters) if name.isupper())
+    connections = []
+    processes = []
+    try:
+        for part in range(partitions):
+            (connection, workerConnection) = Pipe()
+            process = Process(target=partitionWorker, args=(workerConnection, worldFile, owner, part, seeds[part], params))
+            process.start()
+            workerConnection.close()
+            connections.append(connection)
+            processes.append(process)
+        cars = 0
+        nextTimes = []
+        for connection in connections:
+            (partCars, nextTime) = connection.recv()
+            cars += partCars
+            nextTimes.append(nextTime)
+        stats = EvacuationStats(cars, parameters.STATS_QUANTILES)
+        keepCurve = bool(parameters.KEEP_EXIT_CURVE)
+        exitTimes = [0]
+        exitedCount = [0]
+        exited = 0
+        inboxes = [[] for part in range(partitions)]
+        windows = 0
+        messages = 0
+        simulationTime = 0
+        while(True):
+            pending = [min([nextTimes[part]] + [message[0] for message in inboxes[part]]) for part in range(partitions)]
+            start = min(pending)
+            if(start == float('inf')):
+                break
+            end = start + window
+            active = [part for part in range(partitions) if pending[part] < end]
+            for part in active:
+                connections[part].send(('window', end, exited, sorted(inboxes[part])))
+                inboxes[part] = []
+            windowExits = []
+            for part in active:
+                (outbox, exits, nextTimes[part]) = connections[part].recv()
+                for (destination, message) in outbox:
+                    inboxes[destination].append(message)
+                messages += len(outbox)
+                windowExits.extend(exits)
+            windowExits.sort()
+            for (time, exitNode, tripTime) in windowExits:
+                exited += 1
+                simulationTime = time
+                stats.record(time, exitNode, tripTime)
+                if(keepCurve):
+                    exitTimes.append(time)
+                    exitedCount.append(exited)
+            windows += 1
+        partitionEvents = []
+        sleeps = 0
+        for connection in connections:
+            connection.send(('stop',))
+        for connection in connections:
+            result = connection.recv()
+            partitionEvents.append(result['events'])
+            sleeps += result['blocking']['sleeps']
+        events = sum(partitionEvents)
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if(process.is_alive()):
+                process.terminate()
+    if(not keepCurve):
+        (exitTimes, exitedCount) = stats.curve()
+    parallelStats.update({'events': events, 'windows': windows, 'messages': messages, 'cars': cars, \
+        'simulationTime': simulationTime, 'partitions': partitions, 'partitionEvents': partitionEvents})
+    if output:
+        simulator.writeExitCurve(exitTimes, exitedCount)
+    if store is not None:
+        store.write([{'params': simulator.runParameters(), 'seed': seedSequence.entropy, 'exitTimes': exitTimes, \
+            'exitedCount': exitedCount, 'stats': stats.report([node.id for node in network.nodes])}])
+    if parameters.DEBUG:
+        print("Events processed: " + str(events) + " in " + str(windows) + " windows of " + str(window) + ", " \
+            + str(messages) + " messages between " + str(partitions) + " partitions, " + str(len(links)) \
+            + " boundary links. Cars put to sleep: " + str(sleeps))
+    return (np.array(exitTimes), np.array(exitedCount))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run one evacuation over several worker processes')
+    parser.add_argument('--partitions', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--world', default=os.path.join(CURRENT_DIRECTORY, 'world.csv'))
+    parser.add_argument('--param', action='append', default=[], help='NAME=value parameter for the run')
+    args = parser.parse_args()
+    setParameters({'VISUAL': 0})
+    for argument in args.param:
+        (name, values) = parseGridArgument(argument)
+        setParameters({name: values[0]})
+    (exitTimes, exitedCount) = simulate(args.world, args.seed, args.partitions, output=False)
+    print(str(int(exitedCount[-1])) + " cars out at " + str(exitTimes[-1]))
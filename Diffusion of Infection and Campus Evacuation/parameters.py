@@ -4,16 +4,38 @@ PARKING_NODE_COLOR = '#FF0099'
 EXIT_NODE_COLOR = 'r'
 STREET_NODE_COLOR = 'g'
 COP_NODE_COLOR = '#3c3ccc'
-VISUAL = 1
+VISUAL = 1                  #record an occupancy trace for render.py
+TRACE_INTERVAL = 60         #simulation time between trace samples
+INSTRUMENT = 0              #write an event loop report, see Instrumentation.py
+INSTRUMENT_SAMPLE = 1000    #events between samples of the event list length
+KEEP_EXIT_CURVE = 1         #keep every exit in the curve; 0 keeps only the 1% milestones
+STATS_QUANTILES = [0.5, 0.9, 0.99]  #evacuation and trip time quantiles reported
 COP_MODE = 0
 COP_INTERSECTION_THRESHOLD = 0
 COP_CONGESTION_THRESHOLD = 0.5
 COP_EVACUATION_THRESHOLD = 0
-DEPTH_OF_AWARENESS = 1
+DEPTH_OF_AWARENESS = 1      #hops a cop or aware driver looks ahead with 'exit' routing
+ROUTING_POLICY = 'local'    #'local': cops weigh one hop, 'exit': cops weigh congested time to exit
+CONGESTION_WEIGHT = 1.0     #travel time multiplier per unit of occupancy in 'exit' routing
+DRIVER_AWARENESS = 0        #probability a driver without a cop routes by time to exit
 EAST_TENDENCY = 0
 SPACE_TIME_TRADEOFF = 1
 DEAD_END = []
 IF_MUTATE = 0
+EVENT_SCHEDULER = 'heap'    #'heap' or 'calendar'
+PATH_RECORDING = 'off'      #'off', 'sampled' or 'full'
+PATH_SAMPLE = 100           #record every PATH_SAMPLE-th car when sampled
+RANDOM_BLOCK_SIZE = 4096    #variates generated at a time per random stream
+PARKING_RELEASE = 'scheduled'  #'scheduled', 'deterministic', 'poisson' or 'staged', see Arrivals.py
+PARKING_HEADWAY = 1.0       #time between the cars of a lot, the mean gap with 'poisson'
+PARKING_STAGES = [(0, 0.5), (600, 0.5)]  #(start, fraction of every lot) of each wave with 'staged'
+CACHE_SIZE = 1 << 30        #bytes of results a ResultCache keeps before evicting the least recently used
+BOUND_SIZE = 25000          #nodes x time steps of the quickest flow network when its step is automatic
+PARALLEL_CREDIT_DELAY = 1   #time before a slot freed on a boundary street is seen upstream, see parallel.py
+CTM_TIME_STEP = 1.0         #seconds per step of the cell-transmission engine
+CTM_SATURATION_FLOW = 0.5   #cars per second a cell passes on, the DES serves a head car about every 2s
+CTM_MAX_TIME = 200000       #give up on cars still inside after this long
+EXITS = [(760,555), (723,32), (733,270)]   #end points of the evacuation destinations in world.csv
 #Simulation parameter
 UNIT_LENGTH = math.ceil(5000/738)   #ft
 AVERAGE_CAR_SPACE_LENGTH = 20 #ft
@@ -0,0 +1,268 @@
+import math
+import argparse
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import maximum_flow
+import parameters
+import simulator
+from Routing import timeToExit
+from sweep import expandGrid, setParameters, parseGridArgument
+
+#Quickest flow lower bound on the evacuation time.
+#The world from processInput/buildGraph is unrolled into a time-expanded
+#network of steps of step time units. Every non-exit node v has a copy in(v, k)
+#and out(v, k) per step k: a car at in(v, k) has reached the end of v during
+#step k, and every move it makes from there follows the car-level timing at its
+#fastest:
+#   source -> in(lot, k): the cars of the lot the arrival process can release
+#       in step k at the earliest (see earliest() in Arrivals.py)
+#   in(v, k) -> in(v, k + 1): cars still on v, at most its capacity
+#   in(v, k) -> out(v, k): cars leaving v. A node with several children, or an
+#       exit, lets a car go at most every time unit, so step cars per step;
+#       any other node has no limit
+#   out(v, k) -> in(c, k + (d + minTravelTime(v)) // step) to every child c,
+#       d being the time unit spent at an intersection (0 for a single child)
+#   out(v, k) -> sink if k + (1 + d) // step is in the horizon, for a node
+#       ending at an exit; such a node never turns anywhere else
+#Cars driving along a street take no room, so no schedule of the car-level
+#simulator gets more cars out by a time than the maximum flow into the sink
+#with that time as horizon. The time the first X of the cars can be out at the
+#soonest is the smallest horizon whose flow reaches them. None of this depends
+#on the cop, turning or routing parameters, so one bound serves every policy of
+#a sweep on the same world.
+#The bound is valid but loose. Queueing at intersections, cop decisions and
+#cars blocking a street as they drive along it are all left out, so on
+#world.csv it is several times below what the car-level simulator gets. By
+#the bound, half of the cars can be out at 630 at the automatic step of 10, or
+#at 671 at step 1, while simulated runs take about 4450. For 90% of the cars
+#it is 1200 and 1235, and for 99% 1350 and 1390. A coarser step loosens it
+#further. Use it to screen out scenarios and as a floor, not as an estimate.
+#The slow maximum flows are the long, nearly saturated horizons: at step 1 a
+#horizon of 1235 takes about 16 s against 0.2 s for 630. Two options keep the
+#cost down. limit, e.g. a simulated evacuation time, caps the horizons
+#searched, and past it only "later than limit" is reported. refine redoes the
+#search at a finer step, starting from the coarse answers. On world.csv,
+#refining to step 1 takes about 4 minutes for all three fractions, against
+#about 11 from scratch; for the first half alone it takes about a second.
+
+#Parameters the bound depends on, scenarios differing only in others share it
+BOUND_PARAMETERS = ['EXITS', 'UNIT_LENGTH', 'AVERAGE_CAR_SPACE_LENGTH', 'AVERAGE_CAR_SPEED', \
+    'PARKING_RELEASE', 'PARKING_HEADWAY', 'PARKING_STAGES']
+
+#The arrays of world's network the expanded network is unrolled from: the time
+#steps every car is released in, per lot, and the links in and out of the nodes
+def buildBound(world, step=None):
+    network = world.network
+    n = network.size
+    mtt = network.minTravelTime
+    childCount = np.diff(network.childStart)
+    d = (childCount > 1).astype(np.int64)
+    exitParent = network.exitChild != -1
+    earliest = getattr(world.release, 'earliest', lambda lot, n: 0)
+    lots = [node for node in world.nodes if node.type == node.TYPE_PARKING and node.held > 0]
+    releases = [lot.minTravelTime + np.array([earliest(lot, ndx) for ndx in range(lot.held)], dtype=np.float64) for lot in lots]
+    distance = timeToExit(network)
+    reachable = sum(lot.held for lot in lots if np.isfinite(distance[lot.index]))
+    #A rough evacuation time: the last release or all cars through the exits
+    #at a car per time unit, plus the longest drive out
+    last = max([float(times[-1]) for times in releases] + [0.0])
+    estimate = max(last, world.population / max(1, int(exitParent.sum()))) + \
+        float(np.max(distance[np.isfinite(distance)], initial=0)) + 2
+    if(step is None):
+        step = max(1, int(math.ceil(n * estimate / parameters.BOUND_SIZE)))
+    assert(step >= 1)
+    step = int(step)
+    parent = np.repeat(np.arange(n), childCount)
+    child = network.childIndex.astype(np.int64)
+    moving = ~network.isExit[child] & ~exitParent[parent] & ~network.isExit[parent]
+    return {'network': network, 'step': step, 'cars': world.population, 'reachable': reachable, \
+        'estimate': estimate, 'lots': np.array([lot.index for lot in lots], dtype=np.int64), \
+        'releaseSteps': [np.floor(times / step).astype(np.int64) for times in releases], \
+        'limited': ((childCount > 1) | exitParent) & ~network.isExit, \
+        'moveFrom': parent[moving], 'moveTo': child[moving], \
+        'moveShift': ((d + mtt.astype(np.int64)) // step)[parent[moving]], \
+        'exitFrom': np.nonzero(exitParent)[0], 'exitShift': ((1 + d) // step)[exitParent]}
+
+#Maximum number of cars out by the end of step horizon
+def carsOut(bound, horizon):
+    network = bound['network']
+    n = network.size
+    cars = bound['cars']
+    layers = horizon + 1
+    source = 2 * n * layers
+    sink = source + 1
+    k = np.arange(layers)
+    inNode = lambda v, k: 2 * (k * n + v)
+    tails = []
+    heads = []
+    capacities = []
+    def link(tail, head, capacity):
+        tails.append(tail.ravel())
+        heads.append(head.ravel())
+        capacities.append(np.broadcast_to(capacity, tail.shape).ravel())
+    nodes = np.nonzero(~network.isExit)[0]
+    split = np.where(bound['limited'][nodes], bound['step'], cars)
+    link(inNode(nodes[None, :], k[:, None]), inNode(nodes[None, :], k[:, None]) + 1, split[None, :])
+    storage = np.minimum(network.capacity[nodes], cars)
+    link(inNode(nodes[None, :], k[:-1, None]), inNode(nodes[None, :], k[1:, None]), storage[None, :])
+    for (shift, fromNodes, toNodes) in ((bound['moveShift'], bound['moveFrom'], bound['moveTo']), \
+        (bound['exitShift'], bound['exitFrom'], None)):
+        (steps, links) = np.nonzero(k[:, None] + shift[None, :] <= horizon)
+        if(toNodes is None):
+            link(inNode(fromNodes[links], steps) + 1, np.full(len(steps), sink), cars)
+        else:
+            link(inNode(fromNodes[links], steps) + 1, inNode(toNodes[links], steps + shift[links]), cars)
+    for (lot, releaseSteps) in zip(bound['lots'], bound['releaseSteps']):
+        counts = np.bincount(releaseSteps[releaseSteps <= horizon], minlength=layers)
+        steps = np.nonzero(counts)[0]
+        link(np.full(len(steps), source), inNode(lot, steps), counts[steps])
+    tails = np.concatenate(tails)
+    heads = np.concatenate(heads)
+    capacities = np.concatenate(capacities)
+    keep = capacities > 0
+    graph = sparse.csr_matrix((capacities[keep].astype(np.int32), (tails[keep], heads[keep])), shape=(sink + 1, sink + 1))
+    return int(maximum_flow(graph, source, sink, method='dinic').flow_value)
+
+#Fewest steps for target cars to get out, low being a horizon out(low) falls
+#short at and cap, if given, one out(cap) reaches. At most rate cars a step
+#get out, so no horizon below
+#low + (target - out(low)) / rate will do. The search jumps from below at the
+#pace the flow last grew, never slower than rate / 8 nor by fewer than 1, 2,
+#4, ... steps, until target is reached. The last jump is then narrowed down by
+#interpolation, bisecting whenever that did not halve it. Horizons short of the
+#answer are the cheap ones to solve, so few are probed past it.
+def quickestHorizon(out, target, low, rate, cap=None):
+    least = 1
+    pace = float(rate)
+    while(True):
+        high = low + max(int(math.ceil((target - out(low)) / pace)), least)
+        if(cap is not None):
+            high = min(high, cap)
+        if(out(high) >= target):
+            break
+        pace = min(rate, max(rate / 8.0, (out(high) - out(low)) / float(high - low)))
+        (low, least) = (high, 2 * least)
+    halved = True
+    while(high - low > 1):
+        width = high - low
+        if(halved):
+            middle = low + int(math.ceil((target - out(low)) * width / float(out(high) - out(low))))
+            middle = min(high - 1, max(low + 1, middle))
+        else:
+            middle = (low + high) // 2
+        if(out(middle) >= target):
+            high = middle
+        else:
+            low = middle
+        halved = 2 * (high - low) <= width
+    return high
+
+#Fewest steps of bound for each of fractions of the cars to get out, None for
+#a fraction that cannot get out at all and cap + 1 for one that cannot within
+#cap steps. starts maps a fraction to a horizon to search up from.
+def searchHorizons(bound, fractions, cap=None, starts=None):
+    flows = {}
+    def out(horizon):
+        if(horizon not in flows):
+            flows[horizon] = carsOut(bound, horizon)
+        return flows[horizon]
+    horizons = {}
+    low = 0
+    for fraction in sorted(set(fractions)):
+        target = max(1, int(math.ceil(fraction * bound['cars'] - 1e-9)))
+        if(target > bound['reachable']):
+            horizons[fraction] = None
+            continue
+        if(cap is not None and out(cap) < target):
+            horizons[fraction] = cap + 1
+            continue
+        start = (starts or {}).get(fraction)
+        if(start is not None and start > low and out(start) < target):
+            low = start
+        high = quickestHorizon(out, target, low, bound['step'] * len(bound['exitFrom']), cap)
+        low = high - 1
+        horizons[fraction] = high
+    if parameters.DEBUG:
+        print("Quickest flow bound over " + str(len(flows)) + " horizons, step " + str(bound['step']))
+    return horizons
+
+#Soonest times the first fractions of the cars can be out of worldFile under
+#the current parameters, None for a fraction that cannot get out at all.
+#With limit, horizons past limit time units are not searched and a fraction
+#that cannot be out by then gets the first step boundary after limit, still a
+#lower bound. With refine, a step finer than the coarse one, the search is
+#redone at that step from the coarse answers.
+#Returns the number of cars, the time step used, the times by fraction and the
+#fractions the limit cut short.
+def evacuationBound(worldFile='world.csv', fractions=(0.5, 0.9, 0.99), step=None, limit=None, refine=None):
+    world = simulator.buildGraph(simulator.processInput(worldFile))
+    bound = buildBound(world, step)
+    cap = None if limit is None else int(limit // bound['step'])
+    horizons = searchHorizons(bound, fractions, cap)
+    if(refine is not None and refine < bound['step']):
+        coarse = bound['step']
+        bound = buildBound(world, refine)
+        cap = None if limit is None else int(limit // refine)
+        starts = dict((fraction, max(0, horizon * coarse // refine - 1)) for (fraction, horizon) in horizons.items() \
+            if horizon is not None)
+        horizons = searchHorizons(bound, fractions, cap, starts)
+    step = bound['step']
+    timeTo = dict((str(fraction), None if horizon is None else horizon * step) for (fraction, horizon) in horizons.items())
+    capped = [str(fraction) for (fraction, horizon) in sorted(horizons.items()) if cap is not None and horizon == cap + 1]
+    return {'cars': bound['cars'], 'step': step, 'timeTo': timeTo, 'capped': capped}
+
+#How many times the bound each evacuation time of a run's report is
+#(simulator.runReport or EvacuationStats.report), by fraction; 1 is optimal
+def optimalityGap(report, bound):
+    gaps = {}
+    for (fraction, time) in report['timeTo'].items():
+        best = bound['timeTo'].get(fraction)
+        gaps[fraction] = time / best if(time is not None and best) else None
+    return gaps
+
+#Bound of every scenario of grid, computed once per distinct set of
+#BOUND_PARAMETERS values, see evacuationBound for limit and refine. Returns a
+#list of (scenario, bound).
+def screen(grid, worldFile='world.csv', fractions=(0.5, 0.9, 0.99), step=None, limit=None, refine=None):
+    scenarios = expandGrid(grid)
+    saved = dict((name, getattr(parameters, name)) for name in BOUND_PARAMETERS)
+    bounds = {}
+    results = []
+    try:
+        for scenario in scenarios:
+            values = dict((name, scenario.get(name, saved[name])) for name in BOUND_PARAMETERS)
+            key = repr(sorted(values.items()))
+            if(key not in bounds):
+                setParameters(values)
+                bounds[key] = evacuationBound(worldFile, fractions, step, limit, refine)
+            results.append((scenario, bounds[key]))
+    finally:
+        setParameters(saved)
+    return results
+
+#The scenarios of grid that might get fraction of the cars out within limit,
+#e.g. the best time a sweep has seen so far; the rest cannot beat it. No
+#horizon past limit is searched.
+def prune(grid, limit, fraction=1.0, worldFile='world.csv', step=None, refine=None):
+    kept = []
+    for (scenario, bound) in screen(grid, worldFile, (fraction,), step, limit, refine):
+        time = bound['timeTo'][str(fraction)]
+        if(time is not None and time <= limit):
+            kept.append(scenario)
+    return kept
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Quickest flow lower bound on the evacuation time')
+    parser.add_argument('--param', action='append', default=[], help='NAME=v1,v2,... grid values for a parameter')
+    parser.add_argument('--world', default='world.csv')
+    parser.add_argument('--step', type=int, default=None)
+    parser.add_argument('--fraction', type=float, action='append', default=None, help='fractions of the cars out')
+    parser.add_argument('--limit', type=float, default=None, help='search no horizon past this time, e.g. a simulated evacuation time')
+    parser.add_argument('--refine', type=int, default=None, help='redo the search at this finer step')
+    args = parser.parse_args()
+    grid = dict(parseGridArgument(argument) for argument in args.param)
+    fractions = tuple(args.fraction) if args.fraction else (0.5, 0.9, 0.99)
+    for (scenario, bound) in screen(grid, args.world, fractions, args.step, args.limit, args.refine):
+        print(str(scenario) + " cars " + str(bound['cars']) + " step " + str(bound['step']) + " " + \
+            " ".join(fraction + " out " + ("after " if fraction in bound['capped'] else "") + str(time) \
+            for (fraction, time) in sorted(bound['timeTo'].items())))
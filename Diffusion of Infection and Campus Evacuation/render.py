@@ -0,0 +1,132 @@
+import os
+import shutil
+import argparse
+import subprocess
+from multiprocessing import Pool
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import networkx as nx
+import numpy as np
+from parameters import *
+from Trace import loadTrace
+
+#Offline renderer for occupancy traces recorded by simulate() with VISUAL on.
+#The graph, node positions and label groups are built once per trace; each
+#frame only recolors the nodes and rewrites the car counts. Frames are drawn
+#over a process pool and can be joined into a video with ffmpeg.
+
+#Build the drawing layout from the static part of a trace, the same picture
+#showGraph used to draw: nodes at their start point, exits at their end point
+#with an extra node for the start, edges between connected streets, and the car
+#counts of nodes sharing a start point summed into one label.
+def buildLayout(trace):
+    ids = trace['ids']
+    n = len(ids)
+    order = np.argsort(ids, kind='stable')
+    G = nx.Graph()
+    pos = {}
+    labelOwner = np.zeros(n, dtype=np.int64)
+    owners = {}
+    exits = 1
+    for ndx in order:
+        id = int(ids[ndx])
+        if(trace['isExit'][ndx]):
+            G.add_node(n + exits)
+            pos[n + exits] = tuple(trace['start'][ndx])
+            G.add_node(id)
+            pos[id] = tuple(trace['end'][ndx])
+            G.add_edge(n + exits, id)
+            labelOwner[ndx] = id
+            exits += 1
+        else:
+            key = tuple(trace['start'][ndx])
+            if(key not in owners):
+                owners[key] = id
+            labelOwner[ndx] = owners[key]
+            G.add_node(id)
+            pos[id] = key
+    for (parent, child) in trace['edges']:
+        if(not trace['isExit'][child] and not trace['isExit'][parent]):
+            G.add_edge(int(ids[parent]), int(ids[child]))
+    ndxById = dict((int(ids[ndx]), ndx) for ndx in range(n))
+    return {'graph': G, 'pos': pos, 'labelOwner': labelOwner, 'ndxById': ndxById}
+
+def nodeColors(layout, trace, cops):
+    colors = []
+    for id in layout['graph'].nodes():
+        ndx = layout['ndxById'].get(id)
+        if(ndx is None or trace['isExit'][ndx]):
+            colors.append(EXIT_NODE_COLOR)
+        elif(trace['isParking'][ndx]):
+            colors.append(PARKING_NODE_COLOR)
+        elif(cops[ndx]):
+            colors.append(COP_NODE_COLOR)
+        else:
+            colors.append(STREET_NODE_COLOR)
+    return colors
+
+def nodeLabels(layout, counts):
+    labels = {}
+    for (ndx, owner) in enumerate(layout['labelOwner']):
+        labels[int(owner)] = labels.get(int(owner), 0) + int(counts[ndx])
+    return labels
+
+#Worker state, filled once per process by initWorker
+worker = {}
+
+def initWorker(traceFile, outDirectory):
+    worker['trace'] = loadTrace(traceFile)
+    worker['layout'] = buildLayout(worker['trace'])
+    worker['out'] = outDirectory
+
+def renderFrame(frame):
+    trace = worker['trace']
+    layout = worker['layout']
+    fig = plt.figure(figsize=(16, 8))
+    ax1 = fig.add_subplot(1, 2, 1)
+    nx.draw(layout['graph'], layout['pos'], ax=ax1, node_color=nodeColors(layout, trace, trace['cops'][frame]), node_size=120)
+    nx.draw_networkx_labels(layout['graph'], layout['pos'], nodeLabels(layout, trace['counts'][frame]), ax=ax1, font_size=8)
+    ax1.set_title('Time: ' + str(round(float(trace['times'][frame]), 1)))
+    ax2 = fig.add_subplot(1, 2, 2)
+    ax2.set_xlabel('Simulation time')
+    ax2.set_ylabel('Exited car count')
+    ax2.plot(trace['times'][:frame + 1], trace['exited'][:frame + 1], linewidth=2.0)
+    fileName = os.path.join(worker['out'], 'frame%06d.png' % frame)
+    fig.savefig(fileName)
+    plt.close(fig)
+    return fileName
+
+#Render every step-th sample of traceFile to PNG frames in outDirectory and,
+#when video is given and ffmpeg is installed, join them into a video.
+def render(traceFile, outDirectory, processes=None, step=1, video=None, fps=10):
+    if(not os.path.isdir(outDirectory)):
+        os.makedirs(outDirectory)
+    frames = range(0, len(loadTrace(traceFile)['times']), step)
+    with Pool(processes, initializer=initWorker, initargs=(traceFile, outDirectory)) as pool:
+        files = pool.map(renderFrame, frames)
+    if(video is not None):
+        if(shutil.which('ffmpeg') is None):
+            print("ffmpeg not found, leaving frames in " + outDirectory)
+        else:
+            #Frames are renumbered through symlinks so a stepped render has no gaps
+            for (ndx, fileName) in enumerate(files):
+                link = os.path.join(outDirectory, 'video%06d.png' % ndx)
+                if(os.path.lexists(link)):
+                    os.remove(link)
+                os.symlink(os.path.basename(fileName), link)
+            subprocess.check_call(['ffmpeg', '-y', '-loglevel', 'error', '-framerate', str(fps), \
+                '-i', os.path.join(outDirectory, 'video%06d.png'), '-pix_fmt', 'yuv420p', video])
+    return files
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render an evacuation occupancy trace')
+    parser.add_argument('trace')
+    parser.add_argument('--out', default='frames')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--step', type=int, default=1)
+    parser.add_argument('--video', default=None)
+    parser.add_argument('--fps', type=int, default=10)
+    args = parser.parse_args()
+    files = render(args.trace, args.out, args.processes, args.step, args.video, args.fps)
+    print("Rendered " + str(len(files)) + " frames to " + args.out)
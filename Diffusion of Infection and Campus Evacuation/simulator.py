@@ -1,16 +1,22 @@
 import csv
 import math
-import networkx as nx
 import numpy as np
 from scipy import stats
 import matplotlib.pyplot as plt
 from Objects import *
+from Scheduler import createScheduler
+from Network import Network
+from Trace import OccupancyTrace
+from Routing import RoutingPolicy
+from Triggers import Trigger, TriggerSet, CopsLeave
+from RandomStreams import RandomStreams
+from Instrumentation import Instrumentation
+from Statistics import EvacuationStats
+from Arrivals import Scheduled, Deterministic, Poisson, Staged
+import parameters
 from parameters import *
-from copy import deepcopy
-from heapq import heappush, heappop, heapify
 import time as t
-import sys
-sys.setrecursionlimit(10**6)
+import pickle
 
 #Process the input file and return the rows of split data.
 def processInput(inputFile):
@@ -22,92 +28,17 @@ def processInput(inputFile):
 
     return rows[1:]
 
-#Binary search for node in a list of nodes
-def findNode(nodes, node, i, j):
-    end = node.end
-    if((j-i) == 1):
-        if(nodes[i].start == end or nodes[j].start == end):
-            #Check for left
-            while(i >= 0 and nodes[i].start == end):
-                node.addChildNode(nodes[i])
-                i -= 1
-            while(j < len(nodes) and nodes[j].start == end):
-                node.addChildNode(nodes[j])
-                j += 1
-    else:
-        n = int(math.ceil((j-i)/2.0)) + i
-        if(nodes[n].start == end):
-            while(n >= 0 and nodes[n].start == end):
-                node.addChildNode(nodes[n])
-                n -= 1
-            n = int(math.ceil((j-i)/2.0)) + i + 1
-            while(n < len(nodes) and nodes[n].start == end):
-                node.addChildNode(nodes[n])
-                n += 1
-        elif(nodes[n].start < end):
-            findNode(nodes, node, n, j)
-        else:
-            findNode(nodes, node, i, n)
-
-#Graphing function to show the node connections
-def showGraph(nodes, time, x, y):
-    plt.figure(1)
-    plt.clf()
-    nodes = deepcopy(nodes)
-    nodes = sorted(nodes, key=lambda node: node.id)
-    G=nx.Graph()
-    colors = []
-    labels={}
-    labelDict = {}
-    exits = 1
-    for node in nodes:
-        if(node.exit):
-            G.add_node(len(nodes) + exits, pos=node.start)
-            G.add_node(node.id, pos=node.end)
-            colors.append(EXIT_NODE_COLOR)
-            labels[node.id] = node.carCount()
-            G.add_edge(len(nodes) + exits, node.id)
-            exits += 1
-        else:
-            if str(node.start) not in labelDict.keys():
-                labelDict[str(node.start)] = node.id
-                labels[node.id] = node.carCount()
-            else:
-                samePositionedNode = labelDict[str(node.start)]
-                labels[samePositionedNode] += node.carCount()
-            G.add_node(node.id, pos=node.start)
-            if(node.type == Node.TYPE_STREET):
-                if(node.cop):
-                    colors.append(COP_NODE_COLOR)
-                else:
-                    colors.append(STREET_NODE_COLOR) 
-            else:
-                colors.append(PARKING_NODE_COLOR)
-
-            children = node.getChildren()
-            for child in children:
-                if(not child.exit):
-                    G.add_edge(node.id, child.id)
-
-    pos=nx.get_node_attributes(G,'pos')
-    pos=nx.spring_layout(G, pos=pos, fixed=pos.keys())
-    nx.draw(G,pos,node_color=colors)
-    nx.draw_networkx_labels(G,pos,labels,font_size=16)
-    plt.text(0,0,s='Time: ' + str(time))
-    plt.draw()
-    plt.figure(2)
-    plt.clf()
-    plt.xlabel('Simulation time')
-    plt.ylabel('Exited car count')
-    plt.plot(x, y, linewidth=2.0)
-
-#Init function that builds the world using the parsed rows
-def buildGraph(rows):
+#Init function that builds the world using the parsed rows.
+#random is the RandomStreams of the run, a fresh unseeded one if not given.
+#parkingLots, a set of node indices, limits the lots that are filled with cars.
+def buildGraph(rows, random=None, parkingLots=None):
+    if(random is None):
+        random = RandomStreams(blockSize=parameters.RANDOM_BLOCK_SIZE)
     maxMinTravelTimeforAll = 0
     nodes = []
+    parkings = []
     i = 1
-    carId = 1
-    events = []
+    events = createScheduler(parameters.EVENT_SCHEDULER)
     for row in rows:
         assert(len(row) == 7)
 
@@ -115,9 +46,9 @@ def buildGraph(rows):
         if(row[0] == 'Street'):
             nodeType = Node.TYPE_STREET
             distance = int( math.sqrt((int(row[1]) - int(row[3])) ** 2 + (int(row[2]) - int(row[4])) ** 2) \
-                * UNIT_LENGTH )
-            capacity = int( 1.0 * distance / AVERAGE_CAR_SPACE_LENGTH ) * int(row[5])
-            minTravelTime = int( 1.0 * distance / AVERAGE_CAR_SPEED )
+                * parameters.UNIT_LENGTH )
+            capacity = int( 1.0 * distance / parameters.AVERAGE_CAR_SPACE_LENGTH ) * int(row[5])
+            minTravelTime = int( 1.0 * distance / parameters.AVERAGE_CAR_SPEED )
         elif(row[0] == 'Parking'):
             nodeType = Node.TYPE_PARKING
             capacity = int(row[5])
@@ -129,8 +60,8 @@ def buildGraph(rows):
         node = Node(nodeType, (int(row[1]), int(row[2])), (int(row[3]), int(row[4])), capacity, minTravelTime, i, comment=row[6])
         nodes.append(node)
 
-        #Set evacuation destinations
-        if(node.end == (760,555) or node.end == (723,32) or node.end == (733,270)):
+        #Set evacuation destinations: streets ending at one of EXITS or marked 'Exit'
+        if(node.end in parameters.EXITS or row[6] == 'Exit'):
             node.setExit(True)
             node.capacity = 10000 #arbitrary big number
 
@@ -141,54 +72,257 @@ def buildGraph(rows):
             nodes.append(node)
 
         i += 1
-        #Set initial cars in parking lots
         if(nodeType == Node.TYPE_PARKING):
-            for n in range(node.capacity):
-                car = Car(carId)
-                time = minTravelTime + n + genRandom(1)
-                heappush(events, (time, Event(car, Event.TYPE_IN_PARKING)))
-                node.enterCar(car)
-                carId += 1
+            parkings.append(node)
     
-    #Make node connections with its children.    
-    nodes = sorted(nodes, key=lambda node: node.start)
+    #Make node connections with its children: index every node by its start
+    #point, then each node's children are the nodes starting at its end point.
+    starting = {}
+    for node in nodes:
+        starting.setdefault(node.start, []).append(node)
     for node in nodes:
         node.setmaxMinTravelTimeforAll(maxMinTravelTimeforAll)
-        findNode(nodes, node, 0, len(nodes) - 1)
-    return (nodes, events)
-
-def simulate():
-    simulationTime = 0
-    rows = processInput('world.csv')
-    (nodes, events) = buildGraph(rows)
-    itr = 0
-    exitedCount = [0]
-    exitTimes = [0]
-    if VISUAL:
-        showGraph(nodes, simulationTime, exitTimes, exitedCount)
-        plt.show(False)
-    exited = 0
-    f = open("./data/Output" + str(t.time()) + " Cop " + str(COP_MODE) + " Cop intersection threshold " \
-        + str(COP_INTERSECTION_THRESHOLD) + " Cop evacuation threshold " \
-        + str(COP_EVACUATION_THRESHOLD) + " East tendency " + str(EAST_TENDENCY) + ".csv", "w")
+        for child in starting.get(node.end, ()):
+            node.addChildNode(child)
+    network = Network(nodes)
+
+    #Park the cars: car ids run lot by lot from 1 and every lot schedules its
+    #first release; a car is only made when its lot releases it
+    cars = CarStore(pathMode=parameters.PATH_RECORDING, pathSample=parameters.PATH_SAMPLE)
+    world = World(network, cars, events, createRouting(network), random, createRelease())
+    firstId = 1
+    for node in parkings:
+        node.firstId = firstId
+        firstId += node.capacity
+        if(parkingLots is not None and node.index not in parkingLots):
+            continue
+        node.held = node.capacity
+        world.population += node.capacity
+        scheduleRelease(world, node, 0)
+
+    return world
+
+#RoutingPolicy the routing parameters call for, None for plain local routing.
+#current is kept when it was built with the same depth and weight.
+def createRouting(network, current=None):
+    if(parameters.ROUTING_POLICY == 'exit' or parameters.DRIVER_AWARENESS > 0):
+        if(current is not None and current.depth == parameters.DEPTH_OF_AWARENESS \
+            and current.congestionWeight == parameters.CONGESTION_WEIGHT):
+            return current
+        return RoutingPolicy(network, parameters.DEPTH_OF_AWARENESS, parameters.CONGESTION_WEIGHT)
+    elif(parameters.ROUTING_POLICY != 'local'):
+        raise Exception('Unknown routing policy: ' + str(parameters.ROUTING_POLICY))
+    return None
+
+#Arrival process the PARKING_RELEASE parameter names, see Arrivals.py; any other
+#value is taken to be a process itself
+def createRelease():
+    release = parameters.PARKING_RELEASE
+    headway = parameters.PARKING_HEADWAY
+    if(not isinstance(release, str)):
+        return release
+    elif(release == 'scheduled'):
+        return Scheduled(headway)
+    elif(release == 'deterministic'):
+        return Deterministic(headway)
+    elif(release == 'poisson'):
+        return Poisson(1.0 / headway)
+    elif(release == 'staged'):
+        return Staged(parameters.PARKING_STAGES, Scheduled(headway))
+    else:
+        raise Exception('Unknown parking release: ' + str(release))
+
+#Parameters that describe a run, stored with its results
+RUN_PARAMETERS = ['COP_MODE', 'COP_INTERSECTION_THRESHOLD', 'COP_CONGESTION_THRESHOLD', 'COP_EVACUATION_THRESHOLD', \
+    'DEPTH_OF_AWARENESS', 'EAST_TENDENCY', 'SPACE_TIME_TRADEOFF', 'DEAD_END', 'IF_MUTATE', \
+    'ROUTING_POLICY', 'CONGESTION_WEIGHT', 'DRIVER_AWARENESS', 'PARKING_RELEASE', 'PARKING_HEADWAY']
+
+#Values of RUN_PARAMETERS, objects such as a custom arrival process by their repr
+def runParameters():
+    values = {}
+    for name in RUN_PARAMETERS:
+        value = getattr(parameters, name)
+        values[name] = value if isinstance(value, (str, int, float, list, tuple)) else repr(value)
+    return values
+
+#Size of the last run: events processed, cars, the most cars in the network at
+#once and simulation time at the end
+runStats = {'events': 0, 'cars': 0, 'peakCars': 0, 'simulationTime': 0}
+
+#Set up a run of worldFile and return its state, a dictionary holding the
+#world, the triggers, the exit curve so far and the counters of the loop.
+#seed seeds the RandomStreams of the run, runs with the same seed share their
+#random numbers across policies. triggers is a list of Trigger objects fired by
+#the engine on top of the cops leaving once more than COP_EVACUATION_THRESHOLD
+#cars are out. With VISUAL on an occupancy trace is sampled every TRACE_INTERVAL
+#and with INSTRUMENT on the event loop is instrumented, see Instrumentation.py.
+#Exits always feed an EvacuationStats; the full exit curve is only kept with
+#KEEP_EXIT_CURVE on.
+def startRun(worldFile='world.csv', seed=None, triggers=None):
+    random = RandomStreams(seed, parameters.RANDOM_BLOCK_SIZE)
+    resetBlockingStats()
+    world = buildGraph(processInput(worldFile), random)
+    copTrigger = Trigger('exited', parameters.COP_EVACUATION_THRESHOLD, CopsLeave())
+    world.triggers = TriggerSet([copTrigger] + list(triggers or []))
+    trace = None
+    if parameters.VISUAL:
+        trace = OccupancyTrace(world.network, parameters.TRACE_INTERVAL)
+    if parameters.INSTRUMENT:
+        world.instrumentation = Instrumentation(len(world.nodes), parameters.INSTRUMENT_SAMPLE)
+    stats = EvacuationStats(world.population, parameters.STATS_QUANTILES)
+    return {'world': world, 'seed': random.seed, 'copTrigger': copTrigger, 'trace': trace, 'stats': stats, \
+        'keepCurve': bool(parameters.KEEP_EXIT_CURVE), 'exitTimes': [0], 'exitedCount': [0], 'exited': 0, 'events': 0, 'time': 0}
+
+#Process the events of run until none are left, more than untilExited cars
+#are out or an event at or after untilTime has been handled, whichever comes
+#first. Returns True when the run is over.
+def advance(run, untilExited=None, untilTime=None):
+    world = run['world']
+    events = world.events
+    triggerSet = world.triggers
+    trace = run['trace']
+    instrumentation = world.instrumentation
+    if(instrumentation is not None):
+        wallStart = t.perf_counter()
+    cars = world.cars
+    stats = run['stats']
+    keepCurve = run['keepCurve']
+    exitTimes = run['exitTimes']
+    exitedCount = run['exitedCount']
+    exited = run['exited']
+    itr = run['events']
+    simulationTime = run['time']
+    stopExited = float('inf') if untilExited is None else untilExited
+    stopTime = float('inf') if untilTime is None else untilTime
     while len(events) > 0:
-        (time, event) = heappop(events)
+        (time, event) = events.pop()
         simulationTime = time
-        event.eventHandler(events, event, simulationTime)
+        if(instrumentation is None):
+            event.eventHandler(world, event, simulationTime)
+        else:
+            instrumentation.handle(world, event, simulationTime, len(events))
         if(event.type == Event.TYPE_EXIT):
             exited += 1
-            exitedCount.append(exited)
-            exitTimes.append(simulationTime)
-            f.write(str(simulationTime) + "," + str(exited) + "\n")
-        if(exited > COP_EVACUATION_THRESHOLD):
-            for node in nodes:
-                node.setCop(0)
-                node.setCopLeft(1)
-        if(VISUAL and itr % 10000 == 0):
-            showGraph(nodes, simulationTime, exitTimes, exitedCount)
-            plt.pause(0.001)
+            car = event.car
+            stats.record(simulationTime, int(cars.node[car]), simulationTime - float(cars.entryTime[car]))
+            if(keepCurve):
+                exitedCount.append(exited)
+                exitTimes.append(simulationTime)
+            cars.release(car)
+        if(exited > triggerSet.nextExited or simulationTime > triggerSet.nextTime):
+            triggerSet.check(world, exited, simulationTime)
+        if(trace is not None and simulationTime >= trace.nextTime):
+            trace.sample(simulationTime, exited)
+        events.release(event)
         itr += 1
-    f.close()
+        if(exited > stopExited or simulationTime >= stopTime):
+            break
+    if(instrumentation is not None):
+        instrumentation.wall += t.perf_counter() - wallStart
+    run['exited'] = exited
+    run['events'] = itr
+    run['time'] = simulationTime
+    return len(events) == 0
+
+#Wrap up a finished run and return the exit curve as (exit times, exited counts),
+#the stats' 1% milestones when the full curve was not kept. output writes the curve to ./data and store, a ResultStore, gets the run with
+#its parameters and seed. The trace, if any, goes to ./data/Trace<time>.npz or
+#traceFile; draw it with render.py. The instrumentation report, if any, goes to
+#./data/Report<time>.json or reportFile.
+def finishRun(run, output=True, store=None, traceFile=None, reportFile=None):
+    world = run['world']
+    if(run['keepCurve']):
+        exitTimes = run['exitTimes']
+        exitedCount = run['exitedCount']
+    else:
+        (exitTimes, exitedCount) = run['stats'].curve()
+    world.triggers.restore()
+    runStats['events'] = run['events']
+    runStats['cars'] = world.population
+    runStats['peakCars'] = world.cars.size
+    runStats['simulationTime'] = run['time']
+    if output:
+        writeExitCurve(exitTimes, exitedCount)
+    trace = run['trace']
+    if trace is not None:
+        trace.sample(run['time'], run['exited'])
+        if traceFile is None:
+            traceFile = "./data/Trace" + str(t.time()) + ".npz"
+        trace.save(traceFile)
+    if world.instrumentation is not None:
+        if reportFile is None:
+            reportFile = "./data/Report" + str(t.time()) + ".json"
+        world.instrumentation.save(reportFile, world, blockingStats)
+    if store is not None:
+        store.write([{'params': runParameters(), 'seed': run['seed'], 'exitTimes': exitTimes, 'exitedCount': exitedCount, \
+            'stats': runReport(run)}])
+    if parameters.DEBUG:
+        print("Events processed: " + str(run['events']) + " Cars put to sleep: " + str(blockingStats['sleeps']) \
+            + " Retry events avoided: " + str(blockingStats['retriesAvoided']))
+    return (np.array(exitTimes), np.array(exitedCount))
+
+#Write the exit curve to ./data in one go, named after the cop and east settings
+def writeExitCurve(exitTimes, exitedCount):
+    with open("./data/Output" + str(t.time()) + " Cop " + str(parameters.COP_MODE) + " Cop intersection threshold " \
+        + str(parameters.COP_INTERSECTION_THRESHOLD) + " Cop evacuation threshold " \
+        + str(parameters.COP_EVACUATION_THRESHOLD) + " East tendency " + str(parameters.EAST_TENDENCY) + ".csv", "w") as f:
+        f.write("".join(str(exitTimes[i]) + "," + str(exitedCount[i]) + "\n" for i in range(1, len(exitTimes))))
+
+#Key metrics of run, see Statistics.py
+def runReport(run):
+    return run['stats'].report([node.id for node in run['world'].nodes])
+
+#Run one evacuation from start to finish, see startRun and finishRun
+def simulate(worldFile='world.csv', seed=None, output=True, store=None, traceFile=None, triggers=None, reportFile=None):
+    run = startRun(worldFile, seed, triggers)
+    advance(run)
+    return finishRun(run, output, store, traceFile, reportFile)
+
+#Snapshot of run between two events: the world with its event list, node
+#queues, cars and random streams, the triggers, the exit curve so far, the
+#blocking counters and every value in parameters.py. Written to fileName, or
+#returned as bytes when fileName is None.
+def saveCheckpoint(run, fileName=None):
+    parameterValues = dict((name, getattr(parameters, name)) for name in dir(parameters) if name.isupper())
+    data = pickle.dumps({'run': run, 'parameters': parameterValues, 'blockingStats': dict(blockingStats)}, \
+        protocol=pickle.HIGHEST_PROTOCOL)
+    if(fileName is None):
+        return data
+    with open(fileName, 'wb') as f:
+        f.write(data)
+    return fileName
+
+#Load a checkpoint written by saveCheckpoint (bytes or a file name), put its
+#parameters back and then apply params on top of them, so a variant can branch
+#off the shared prefix. Routing is rebuilt when the variant needs a different
+#one, the lots' arrival process when params sets a PARKING_ value, and the cops' departure threshold follows COP_EVACUATION_THRESHOLD as long
+#as it has not been crossed yet. Returns the run, ready for advance.
+def loadCheckpoint(source, params=None):
+    if(isinstance(source, bytes)):
+        data = pickle.loads(source)
+    else:
+        with open(source, 'rb') as f:
+            data = pickle.load(f)
+    for (name, value) in data['parameters'].items():
+        setattr(parameters, name, value)
+    for (name, value) in (params or {}).items():
+        if(not hasattr(parameters, name)):
+            raise Exception('Unknown parameter: ' + name)
+        setattr(parameters, name, value)
+    resetBlockingStats()
+    blockingStats.update(data['blockingStats'])
+    run = data['run']
+    world = run['world']
+    world.routing = createRouting(world.network, world.routing)
+    if(any(name.startswith('PARKING_') for name in (params or {}))):
+        world.release = createRelease()
+    copTrigger = run['copTrigger']
+    if(copTrigger.threshold != parameters.COP_EVACUATION_THRESHOLD):
+        if(copTrigger.fired > 0):
+            raise Exception('The cops already left at the checkpoint, COP_EVACUATION_THRESHOLD cannot change')
+        copTrigger.threshold = parameters.COP_EVACUATION_THRESHOLD
+        world.triggers.rearm()
+    return run
 
 def printDistribution():
     n = 2500
@@ -207,4 +341,5 @@ def printDistribution():
     plt.hist (g)
     plt.show()
 
-simulate()
+if __name__ == '__main__':
+    simulate()
@@ -0,0 +1,151 @@
+import os
+import json
+import itertools
+import argparse
+import numpy as np
+from multiprocessing import Pool
+import parameters
+from ResultStore import ResultStore
+from ResultCache import ResultCache
+
+CURRENT_DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+
+#Parameters every sweep worker runs with on top of its configuration
+WORKER_PARAMETERS = {'VISUAL': 0, 'DEBUG': 0}
+
+#Expand {'COP_MODE': [0, 1], 'EAST_TENDENCY': [0, 0.2]} into one dictionary
+#per configuration, in a stable order.
+def expandGrid(grid):
+    names = sorted(grid.keys())
+    for name in names:
+        if(not hasattr(parameters, name)):
+            raise Exception('Unknown parameter: ' + name)
+    return [dict(zip(names, values)) for values in itertools.product(*[grid[name] for name in names])]
+
+#Overwrite the module level values in parameters.py for this process
+def setParameters(params):
+    for (name, value) in params.items():
+        if(not hasattr(parameters, name)):
+            raise Exception('Unknown parameter: ' + name)
+        setattr(parameters, name, value)
+
+#Worker: run one replica of one configuration and return its exit curve
+def runConfiguration(job):
+    (configNdx, replica, params, seed, worldFile) = job
+    import simulator
+    setParameters(WORKER_PARAMETERS)
+    setParameters(params)
+    run = simulator.startRun(worldFile, seed)
+    simulator.advance(run)
+    (exitTimes, exitedCount) = simulator.finishRun(run, output=False)
+    return {'config': configNdx, 'replica': replica, 'params': simulator.runParameters(), 'seed': seed, \
+        'exitTimes': exitTimes, 'exitedCount': exitedCount, 'stats': simulator.runReport(run)}
+
+#Run every configuration of grid replicas times over a process pool.
+#Each replica gets its own seed spawned from seed, so runs are independent and
+#the whole sweep is reproducible. With commonRandomNumbers replica r of every
+#configuration uses the same seed, so configurations are compared on the same
+#random inputs and their differences need fewer replicas to resolve.
+#Results come back in (config, replica) order and, if store is a ResultStore,
+#the runs simulated are written to it as one shard. With cache, a ResultCache,
+#runs it already holds are not simulated again, nor written to store a second
+#time, and the others are added to it as they finish.
+def sweep(grid, replicas=1, processes=None, seed=None, worldFile=None, store=None, commonRandomNumbers=False, cache=None):
+    assert(replicas > 0)
+    if(worldFile is None):
+        worldFile = os.path.join(CURRENT_DIRECTORY, 'world.csv')
+    configs = expandGrid(grid)
+    seeds = np.random.SeedSequence(seed).spawn(replicas if commonRandomNumbers else len(configs) * replicas)
+    jobs = []
+    keys = {}
+    results = []
+    for (configNdx, params) in enumerate(configs):
+        for replica in range(replicas):
+            seedNdx = replica if commonRandomNumbers else configNdx * replicas + replica
+            childSeed = int(seeds[seedNdx].generate_state(1)[0])
+            if(cache is not None):
+                key = cache.key(worldFile, childSeed, dict(WORKER_PARAMETERS, **params))
+                result = cache.get(key)
+                if(result is not None):
+                    results.append(dict(result, config=configNdx, replica=replica))
+                    continue
+                keys[(configNdx, replica)] = key
+            jobs.append((configNdx, replica, params, childSeed, worldFile))
+    if(cache is not None):
+        cache.flush()
+        if parameters.DEBUG:
+            print("Found " + str(len(results)) + "/" + str(len(results) + len(jobs)) + " runs in the cache")
+    simulated = []
+    if(len(jobs) > 0):
+        with Pool(processes) as pool:
+            for (done, result) in enumerate(pool.imap_unordered(runConfiguration, jobs)):
+                simulated.append(result)
+                if(cache is not None):
+                    cache.put(keys[(result['config'], result['replica'])], result)
+                if parameters.DEBUG:
+                    print("Finished " + str(done + 1) + "/" + str(len(jobs)) + " " + str(result['params']) \
+                        + " replica " + str(result['replica']))
+    simulated.sort(key=lambda result: (result['config'], result['replica']))
+    if(store is not None):
+        store.write(simulated)
+    results = sorted(results + simulated, key=lambda result: (result['config'], result['replica']))
+    return results
+
+#Worker: branch one configuration off a checkpoint and run it to the end
+def runFromCheckpoint(job):
+    (configNdx, params, checkpoint) = job
+    import simulator
+    run = simulator.loadCheckpoint(checkpoint, params)
+    setParameters({'DEBUG': 0})
+    simulator.advance(run)
+    (exitTimes, exitedCount) = simulator.finishRun(run, output=False)
+    return {'config': configNdx, 'replica': 0, 'params': simulator.runParameters(), 'seed': run['seed'], \
+        'exitTimes': exitTimes, 'exitedCount': exitedCount, 'stats': simulator.runReport(run)}
+
+#Run every configuration of grid from checkpoint, the bytes or file written by
+#simulator.saveCheckpoint, so the prefix the configurations share is simulated
+#once. Every configuration continues with the checkpoint's random streams.
+def sweepFromCheckpoint(checkpoint, grid, processes=None, store=None):
+    configs = expandGrid(grid)
+    jobs = [(configNdx, params, checkpoint) for (configNdx, params) in enumerate(configs)]
+    with Pool(processes) as pool:
+        results = pool.map(runFromCheckpoint, jobs)
+    if(store is not None):
+        store.write(results)
+    return results
+
+#Parse NAME=v1,v2,... into a grid entry. Values are read as JSON when possible.
+def parseGridArgument(argument):
+    (name, values) = argument.split('=', 1)
+    parsed = []
+    for value in values.split(','):
+        try:
+            parsed.append(json.loads(value))
+        except ValueError:
+            parsed.append(value)
+    return (name, parsed)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parameter sweep over the campus evacuation simulator')
+    parser.add_argument('--param', action='append', default=[], help='NAME=v1,v2,... grid values for a parameter')
+    parser.add_argument('--replicas', type=int, default=1)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--world', default=None)
+    parser.add_argument('--store', default=os.path.join(CURRENT_DIRECTORY, 'data', 'runs'))
+    parser.add_argument('--crn', action='store_true', help='use common random numbers across configurations')
+    parser.add_argument('--cache', default=os.path.join(CURRENT_DIRECTORY, 'data', 'cache'), help='result cache directory')
+    parser.add_argument('--no-cache', action='store_true', help='simulate every run, even ones already cached')
+    parser.add_argument('--clear-cache', action='store_true', help='empty the result cache first')
+    args = parser.parse_args()
+    grid = dict(parseGridArgument(argument) for argument in args.param)
+    store = ResultStore(args.store)
+    cache = None
+    if(not args.no_cache):
+        cache = ResultCache(args.cache)
+        if(args.clear_cache):
+            cache.clear()
+        else:
+            cache.invalidate()
+    results = sweep(grid, args.replicas, args.processes, args.seed, args.world, store, args.crn, cache)
+    print("Wrote " + str(len(results)) + " runs to " + args.store)
@@ -0,0 +1,10 @@
+import os
+from benchmark import benchmark
+
+#A --dir that does not exist yet is made before the first size runs
+def test_benchmark_makes_missing_directory(tmp_path):
+    directory = os.path.join(str(tmp_path), 'missing')
+    results = benchmark('grid', (1000,), directory=directory)
+    assert len(results) == 1
+    assert results[0]['cars'] == 1000
+    assert os.path.exists(os.path.join(directory, 'grid-1000.csv'))
@@ -201,7 +201,15 @@ class Node(AbstractHost):
             flow = host.setFlow(flow)
             actualFlow += flow
 
+        self.moveClusters(hosts, actualFlow)
 
+        self.residualVolume -= actualFlow
+        if self.residualVolume < 0:
+            self.residualVolume = 0
+        assert(self.residualVolume <= self.volume)
+
+    #Send about actualFlow / volume of the cells in this vessel on to random hosts
+    def moveClusters(self, hosts, actualFlow):
         approxBacteriaCellsToExit = actualFlow / self.volume * self.getBacteriaCount()
         approxImmuneCellsToExit = actualFlow / self.volume * self.getImmuneCellCount()
         
@@ -231,11 +239,6 @@ class Node(AbstractHost):
             cellsLeftCount += cluster.getCellCount()
             if cellsLeftCount >= approxImmuneCellsToExit:
                 break
-
-        self.residualVolume -= actualFlow
-        if self.residualVolume < 0:
-            self.residualVolume = 0
-        assert(self.residualVolume <= self.volume)
         
     def __repr__(self):
         return "Node: " + self.name + "\n" \
@@ -7,6 +7,7 @@ from globals import globals
 from parameters import *
 from heapq import heappush, heappop
 from AbstractBacteriaCellCluster import *
+from AbstractImmuneCellCluster import *
 
 class Organ(AbstractHost):
     #retention rate.
@@ -25,11 +26,19 @@ class Organ(AbstractHost):
         self._from = _from
         self._sideLengthBoxes = round(0.5+(float(sideLength) / parameters.organ_grid_resolution))
         self._lengthBoxes = round(0.5+(float(length) / parameters.organ_grid_resolution))
-        self._grid = np.empty((self._sideLengthBoxes, self._sideLengthBoxes, self._lengthBoxes), dtype=Container)
-        for i in range(self._sideLengthBoxes):
-            for j in range(self._sideLengthBoxes):
-                for k in range(self._lengthBoxes):
-                    self._grid[i][j][k] = Container()
+        #Sparse voxel grid: only voxels holding a cluster have a Container,
+        #keyed by (x, y, z), so an organ costs nothing per empty voxel
+        self._gridShape = (self._sideLengthBoxes, self._sideLengthBoxes, self._lengthBoxes)
+        self._voxels = {}
+        #Per occupied voxel a slot in the coordinate and cluster count arrays,
+        #kept up to date as clusters come and go; a slot freed when its voxel
+        #empties is reused
+        self._slots = {}
+        self._freeSlots = []
+        self._voxelCoordinates = np.zeros((0, 3), dtype=np.int64)
+        self._occupied = np.zeros(0, dtype=bool)
+        self._bacteriaCounts = np.zeros(0, dtype=np.int64)
+        self._immuneCounts = np.zeros(0, dtype=np.int64)
         xs = np.random.uniform(0, self._sideLengthBoxes, 2)
         ys = np.random.uniform(0, self._sideLengthBoxes, 2)
         zs = np.random.uniform(0, self._lengthBoxes, 2)
@@ -89,10 +98,7 @@ class Organ(AbstractHost):
     def enterImmuneCellCluster(self, cluster):
         assert(isinstance(cluster, AbstractImmuneCellCluster))
         self.immuneCellClusters.append(cluster)
-        container = self._grid[self._grid_entrance.x][self._grid_entrance.y][self._grid_entrance.z]
-        assert container is not None
-
-        container.immuneCellClusters.append(cluster)
+        self.__place(self._grid_entrance, cluster)
         cluster.enterHost(self)
         cluster.setRelativeLocation(self._grid_entrance)
 
@@ -106,7 +112,7 @@ class Organ(AbstractHost):
                 #exit
                 cluster.exitHost()
                 self.immuneCellClusters.remove(cluster)
-                self._grid[self._grid_exit.x][self._grid_exit.y][self._grid_exit.z].removeBacteriaCluster(cluster)
+                self.__leave(self._grid_exit, cluster)
                 heappush(globals.terminalOutputEvent, (globals.time + parameters.vein_travel_time, cluster))                
 
     def getImmuneCellCount(self):
@@ -130,10 +136,7 @@ class Organ(AbstractHost):
     def enterBacteriaCluster(self, cluster):
         assert(isinstance(cluster, AbstractBacteriaCellCluster))
         self.bacteriaClusters.append(cluster)
-        container = self._grid[self._grid_entrance.x][self._grid_entrance.y][self._grid_entrance.z]
-        assert container is not None
-
-        container.bacteriaClusters.append(cluster)
+        self.__place(self._grid_entrance, cluster)
         cluster.enterHost(self)
         cluster.setRelativeLocation(self._grid_entrance)
 
@@ -146,85 +149,137 @@ class Organ(AbstractHost):
             if point == self._grid_exit:
                 #exit
                 cluster.exitHost()
-                self._grid[self._grid_exit.x][self._grid_exit.y][self._grid_exit.z].removeBacteriaCluster(cluster)
+                self.__leave(self._grid_exit, cluster)
                 self.bacteriaClusters.remove(cluster)
                 heappush(globals.terminalOutputEvent, (globals.time + parameters.vein_travel_time, cluster))                
                 
+    #Clusters in the same voxel meet, every ordered pair of them (a cluster
+    #and itself included) in the order the organ holds them
     def interact(self):
         if self.bacteriaClusters:
+            positions = self.__positions(self.bacteriaClusters)
             for bacteriaCluster1 in self.bacteriaClusters:
-                for bacteriaCluster2 in self.bacteriaClusters:
-                    if(bacteriaCluster1.getRelativeLocation()==bacteriaCluster2.getRelativeLocation()):
-                        bacteriaCluster1.inContact(bacteriaCluster2)
-                        bacteriaCluster2.inContact(bacteriaCluster1)
+                for bacteriaCluster2 in self.__inOrder(self.__containerOf(bacteriaCluster1).getBacteriaClusters(), positions):
+                    bacteriaCluster1.inContact(bacteriaCluster2)
+                    bacteriaCluster2.inContact(bacteriaCluster1)
         if self.immuneCellClusters:
+            positions = self.__positions(self.immuneCellClusters)
             for immuneCellCluster1 in self.immuneCellClusters:
-                for immuneCellCluster2 in self.immuneCellClusters:
-                    if(immuneCellCluster1.getRelativeLocation()==immuneCellCluster2.getRelativeLocation()):
-                        immuneCellCluster1.inContact(immuneCellCluster2)
-                        immuneCellCluster2.inContact(immuneCellCluster1)
+                for immuneCellCluster2 in self.__inOrder(self.__containerOf(immuneCellCluster1).getImmuneCellClusters(), positions):
+                    immuneCellCluster1.inContact(immuneCellCluster2)
+                    immuneCellCluster2.inContact(immuneCellCluster1)
         if self.bacteriaClusters and self.immuneCellClusters:
+            positions = self.__positions(self.immuneCellClusters)
             for bacteriaCluster in self.bacteriaClusters:
-                for immuneCellCluster in self.immuneCellClusters:
-                    if(bacteriaCluster.getRelativeLocation()==immuneCellCluster.getRelativeLocation()):
-                        bacteriaCluster.inContact(cluster)
-                        immuneCellCluster.inContact(bacteriaCluster)
+                for immuneCellCluster in self.__inOrder(self.__containerOf(bacteriaCluster).getImmuneCellClusters(), positions):
+                    bacteriaCluster.inContact(immuneCellCluster)
+                    immuneCellCluster.inContact(bacteriaCluster)
+
+    #Voxel within move_range of index on every axis that is nearest the exit.
+    #Voxel coordinates are whole numbers, so on each axis a single coordinate in
+    #reach is nearest the exit's and the nearest voxel is unique: scanning every
+    #voxel in reach for the least exit distance, then the least concentration,
+    #always ends up here.
+    def __towardExit(self, index, move_range):
+        assert index is not None
+        goal = (self._grid_exit.x, self._grid_exit.y, self._grid_exit.z)
+        return tuple(min(max(target, at - move_range, 0), at + move_range, boxes - 1) \
+            for (target, at, boxes) in zip(goal, (index.x, index.y, index.z), self._gridShape))
 
     def moveClusters(self):
         for bacteriaCluster in self.bacteriaClusters:
             index = bacteriaCluster.getRelativeLocation()
-            assert index is not None
             move_range = max(int(bacteriaCluster.getMoveSpeed() / parameters.organ_grid_resolution), 1)
-            concentration = []
-            for i in range(-move_range,move_range+1):
-                if int(index.x + i) < 0 or int(index.x + i) >= len(self._grid):
-                    continue
-                for j in range(-move_range,move_range+1):
-                    if int(index.y + j) < 0 or int(index.y + j) >= len(self._grid[0]):
-                        continue
-                    for k in range(-move_range,move_range+1):
-                        if int(index.z + k) < 0 or int(index.z + k) >= len(self._grid[0][0]):
-                            continue
-                        exitDistanceBias = (self._grid_exit.x - (index.x + i)) ** 2 + (self._grid_exit.y - (index.y + j)) ** 2 + (self._grid_exit.z - (index.z + k)) ** 2
-                        concentration.append((exitDistanceBias, self._grid[index.x + i][index.y + j][index.z + k].getBacteriaClustersConcentration(), (index.x + i, index.y + j, index.z + k)))
-
-            exitDistanceBias, concentration, loc = min(concentration)
-            (new_x, new_y, new_z) = loc
-            assert new_x >= 0 and new_x < len(self._grid)
-            assert new_y >= 0 and new_y < len(self._grid[0])
-            assert new_z >= 0 and new_z < len(self._grid[0][0])
-
+            (new_x, new_y, new_z) = self.__towardExit(index, move_range)
             if(index.x != new_x or index.y != new_y or index.z != new_z):
-                self._grid[index.x][index.y][index.z].removeBacteriaCluster(bacteriaCluster)
-                self._grid[new_x][new_y][new_z].addBacteriaCluster(bacteriaCluster)
+                self.__leave(index, bacteriaCluster)
                 bacteriaCluster.setRelativeLocation(Point(new_x, new_y, new_z))
+                self.__place(bacteriaCluster.getRelativeLocation(), bacteriaCluster)
 
         for immuneCellCluster in self.immuneCellClusters:
             index = immuneCellCluster.getRelativeLocation()
             move_range = max(int(immuneCellCluster.getMoveSpeed() / parameters.organ_grid_resolution), 1)
-            concentration = []
-            for i in range(-move_range, move_range+1):
-                if (index.x + i) < 0 or (index.x + i) >= len(self._grid):
-                    continue
-                for j in range(-move_range, move_range+1):
-                    if (index.y + j) < 0 or (index.y + j) >= len(self._grid[0]):
-                        continue
-                    for k in range(-move_range, move_range+1):
-                        if (index.z + k) < 0 or (index.z + k) >= len(self._grid[0][0]):
-                            continue
-                        exitDistanceBias = (self._grid_exit.x - (index.x + i)) ** 2 + (self._grid_exit.y - (index.y + j)) ** 2 + (self._grid_exit.z - (index.z + k)) ** 2
-                        concentration.append((exitDistanceBias, self._grid[index.x + i][index.y + j][index.z + k].getImmuneCellClustersConcentration(), (index.x + i, index.y + j, index.z + k)))
-           
-            exitDistanceBias, concentration, loc = min(concentration)
-            (new_x, new_y, new_z) = loc
-            assert new_x >= 0 and new_x < len(self._grid)
-            assert new_y >= 0 and new_y < len(self._grid[0])
-            assert new_z >= 0 and new_z < len(self._grid[0][0])
+            (new_x, new_y, new_z) = self.__towardExit(index, move_range)
             if(index.x != new_x or index.y != new_y or index.z != new_z):
-                self._grid[index.x][index.y][index.z].removeImmuneCellClusterCluster(immuneCellCluster)
-                self._grid[new_x][new_y][new_z].addImmuneCellClusterCluster(immuneCellCluster)
+                self.__leave(index, immuneCellCluster)
                 immuneCellCluster.setRelativeLocation(Point(new_x, new_y, new_z))
-    
+                self.__place(immuneCellCluster.getRelativeLocation(), immuneCellCluster)
+
+    #Container of the voxel at point, made when the first cluster moves in
+    def __container(self, point):
+        key = (point.x, point.y, point.z)
+        container = self._voxels.get(key)
+        if container is None:
+            assert all(0 <= x < boxes for (x, boxes) in zip(key, self._gridShape))
+            container = Container()
+            self._voxels[key] = container
+            if not self._freeSlots:
+                size = len(self._occupied)
+                grown = max(2 * size, 16)
+                self._voxelCoordinates = np.concatenate((self._voxelCoordinates, np.zeros((grown - size, 3), dtype=np.int64)))
+                self._occupied = np.concatenate((self._occupied, np.zeros(grown - size, dtype=bool)))
+                self._bacteriaCounts = np.concatenate((self._bacteriaCounts, np.zeros(grown - size, dtype=np.int64)))
+                self._immuneCounts = np.concatenate((self._immuneCounts, np.zeros(grown - size, dtype=np.int64)))
+                self._freeSlots = list(range(grown - 1, size - 1, -1))
+            slot = self._freeSlots.pop()
+            self._slots[key] = slot
+            self._voxelCoordinates[slot] = key
+            self._occupied[slot] = True
+        return container
+
+    def __containerOf(self, cluster):
+        return self.__container(cluster.getRelativeLocation())
+
+    #Put cluster in the voxel at point and count it there
+    def __place(self, point, cluster):
+        container = self.__container(point)
+        slot = self._slots[(point.x, point.y, point.z)]
+        if isinstance(cluster, AbstractBacteriaCellCluster):
+            container.addBacteriaCluster(cluster)
+            self._bacteriaCounts[slot] += 1
+        else:
+            container.addImmuneCellCluster(cluster)
+            self._immuneCounts[slot] += 1
+
+    #Take cluster out of the voxel at point, dropping the voxel once no
+    #cluster is left in it
+    def __leave(self, point, cluster):
+        key = (point.x, point.y, point.z)
+        container = self._voxels[key]
+        slot = self._slots[key]
+        if isinstance(cluster, AbstractBacteriaCellCluster):
+            container.removeBacteriaCluster(cluster)
+            self._bacteriaCounts[slot] -= 1
+        else:
+            container.removeImmuneCellCluster(cluster)
+            self._immuneCounts[slot] -= 1
+        if not container.bacteriaClusters and not container.immuneCellClusters:
+            del self._voxels[key]
+            del self._slots[key]
+            self._occupied[slot] = False
+            self._freeSlots.append(slot)
+
+    def __positions(self, clusters):
+        return dict((id(cluster), n) for (n, cluster) in enumerate(clusters))
+
+    def __inOrder(self, clusters, positions):
+        return sorted(clusters, key=lambda cluster: positions[id(cluster)])
+
+    def getBacteriaConcentration(self, point):
+        slot = self._slots.get((point.x, point.y, point.z))
+        return 0 if slot is None else int(self._bacteriaCounts[slot])
+
+    def getImmuneCellConcentration(self, point):
+        slot = self._slots.get((point.x, point.y, point.z))
+        return 0 if slot is None else int(self._immuneCounts[slot])
+
+    #Occupied voxels as an (n, 3) array of coordinates and the number of
+    #bacteria and immune cell clusters in each
+    def getConcentrations(self):
+        slots = np.nonzero(self._occupied)[0]
+        return {'voxels': self._voxelCoordinates[slots], 'bacteria': self._bacteriaCounts[slots], \
+            'immune': self._immuneCounts[slots]}
+
     def timeStep(self):
         if globals.time % parameters.cell_count_history_interval == 0:
             self.bacteriaCountHistory.append(self.getBacteriaCount())
@@ -256,4 +311,4 @@ class Organ(AbstractHost):
             + "    id: " + str(self.id) + " mass: " + str(self.mass) + " \n" \
             + "    length: " + str(self.length) + "\n" \
             + "    side length: " + str(self.sideLength) + "\n" \
-            + "    health: " + str(self.health) + "\n" \
+            + "    health: " + str(self.health) + "\n"
@@ -0,0 +1,210 @@
+import Node
+from Organ import Organ
+from GenericSink import GenericSink
+import numpy as np
+from parameters import *
+from globals import globals
+
+#Flattened vessel network for vectorized hemodynamics.
+#Hosts are laid out in topological order: the vessels reachable from the
+#ascending aorta, each after all of its parents, then the organs and generic
+#sinks they feed. Per host there are radius, resistance, volume, residual
+#volume and last inflow arrays; children are a CSR (childStart, childIndex)
+#and parent is the vessel a vessel's velocity is derived from. Since a
+#vessel's velocity is its parent's scaled by the ratio of their radii, it is a
+#fixed fraction (velocityRatio) of the heart's.
+#timeStep does what the flow part of Node.timeStep and the hosts' setFlow do
+#for every host. It is not a single set of array operations: a vessel can only
+#pass on blood once everything flowing into it this step is in, so timeStep
+#loops in Python over the depths of the network (19 for the body), deepest
+#parents last, and works out the flows of all links out of one depth with a
+#few array operations. A step costs a Python iteration per depth rather than
+#per host. A vessel fed by several parents is stepped once per step and its
+#last inflow is the total it received. writeBack copies the arrays onto the
+#hosts' residualVolume and lastFlow.
+class VesselNetwork:
+    def __init__(self, head):
+        assert(isinstance(head, Node.Node))
+        #Reachable hosts and the number of parents of each
+        reached = [head]
+        seen = {id(head): 0}
+        parentCount = {}
+        for host in reached:
+            for child in (host.getChildren() or []):
+                parentCount[id(child)] = parentCount.get(id(child), 0) + 1
+                if id(child) not in seen:
+                    seen[id(child)] = len(reached)
+                    reached.append(child)
+        #Kahn's algorithm over the vessels, a sink follows all vessels
+        vessels = []
+        level = {id(head): 0}
+        ready = [head]
+        remaining = dict(parentCount)
+        for vessel in ready:
+            vessels.append(vessel)
+            for child in vessel.getChildren():
+                level[id(child)] = max(level.get(id(child), 0), level[id(vessel)] + 1)
+                remaining[id(child)] -= 1
+                if remaining[id(child)] == 0 and isinstance(child, Node.Node):
+                    ready.append(child)
+        assert len(vessels) == sum(1 for host in reached if isinstance(host, Node.Node)), "vessels form a cycle"
+        sinks = [host for host in reached if not isinstance(host, Node.Node)]
+        self.hosts = vessels + sinks
+        self.vesselCount = len(vessels)
+        self.index = dict((id(host), i) for (i, host) in enumerate(self.hosts))
+        H = len(self.hosts)
+        V = self.vesselCount
+
+        self.radius = np.array([vessel.radius for vessel in vessels] + [0.0] * len(sinks))
+        self.resistance = np.array([vessel._resistance for vessel in vessels] + [np.inf] * len(sinks))
+        self.isOrgan = np.array([isinstance(host, Organ) for host in self.hosts])
+        self.isGenericSink = np.array([isinstance(host, GenericSink) for host in self.hosts])
+        #A generic sink takes whatever comes
+        self.volume = np.array([np.inf if isinstance(host, GenericSink) else host.volume for host in self.hosts])
+        self.residualVolume = np.array([getattr(host, 'residualVolume', 0.0) for host in self.hosts], dtype=np.float64)
+        self.lastFlow = np.zeros(H)
+        self.outflow = np.zeros(V)
+
+        #Velocity of every vessel relative to the heart's, 0 when its parent is
+        #not fed by the heart
+        self.parent = np.full(H, -1, dtype=np.int64)
+        self.velocityRatio = np.zeros(H)
+        self.velocityRatio[0] = 1
+        for (i, vessel) in enumerate(vessels):
+            if i == 0 or vessel._parent is None or id(vessel._parent) not in self.index:
+                continue
+            p = self.index[id(vessel._parent)]
+            self.parent[i] = p
+            self.velocityRatio[i] = self.radius[p] / vessel.radius * self.velocityRatio[p]
+
+        #Children CSR in getChildren order
+        counts = [len(vessel.getChildren()) for vessel in vessels]
+        self.childStart = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.childIndex = np.array([self.index[id(child)] for vessel in vessels for child in vessel.getChildren()], dtype=np.int64)
+
+        #Links grouped by the depth of their parent, kept in parent order
+        edgeParent = np.repeat(np.arange(V), counts)
+        edgeLevel = np.array([level[id(vessels[p])] for p in edgeParent], dtype=np.int64)
+        order = np.argsort(edgeLevel, kind='stable')
+        self.edgeParent = edgeParent[order]
+        self.edgeChild = self.childIndex[order]
+        self.rounds = []
+        bounds = np.concatenate(([0], np.nonzero(np.diff(edgeLevel[order]))[0] + 1, [len(order)]))
+        for (start, stop) in zip(bounds[:-1], bounds[1:]):
+            parents, parentOf = np.unique(self.edgeParent[start:stop], return_inverse=True)
+            children, childOf = np.unique(self.edgeChild[start:stop], return_inverse=True)
+            byChild = np.argsort(childOf, kind='stable')
+            first = np.concatenate(([True], np.diff(childOf[byChild]) != 0))
+            self.rounds.append({'start': start, 'stop': stop, 'parents': parents, 'parentOf': parentOf, \
+                'children': children, 'childOf': childOf, 'byChild': byChild, \
+                'groupStart': np.nonzero(first)[0], 'groupSize': np.diff(np.append(np.nonzero(first)[0], stop - start))})
+
+        #Flow into an organ drains lengthSteps later, as Organ.setFlow schedules it
+        self.organs = np.nonzero(self.isOrgan)[0]
+        self.organLength = np.array([self.hosts[i].length for i in self.organs])
+        self.drains = np.zeros((1, len(self.organs)))
+
+    #Steps until flow into each organ drains, see Organ.setFlow
+    def __drainDelay(self):
+        return (self.organLength / (parameters.sink_velocity * parameters.delta_t * parameters.delta_t)).astype(np.int64)
+
+    #Pump inflow into the heart at velocity and move blood through every vessel
+    #for one time interval. Returns the flow the heart took.
+    def timeStep(self, inflow, velocity):
+        residual = self.residualVolume
+        volume = self.volume
+        lastFlow = self.lastFlow
+        residual[self.isGenericSink] = 0
+        actual = min(inflow, volume[0] - residual[0])
+        residual[0] += actual
+        lastFlow[:] = 0
+        lastFlow[0] = actual
+
+        velocities = velocity * self.velocityRatio
+        velocities[self.vesselCount:] = parameters.sink_velocity * parameters.delta_t
+        p = self.edgeParent
+        deltaP = 0.5 * parameters.blood_density * np.abs(velocities[p] ** 2 - velocities[self.edgeChild] ** 2)
+        potential = np.minimum(deltaP / self.resistance[p] * parameters.delta_t, volume[p])
+        for r in self.rounds:
+            (start, stop) = (r['start'], r['stop'])
+            parents = r['parents']
+            parentOf = r['parentOf']
+            children = r['children']
+            childOf = r['childOf']
+            flows = potential[start:stop]
+            #No pressure drop: pass on what the parent received this step, as
+            #Node.timeStep does after its setFlow
+            flows = np.where(flows == 0, lastFlow[p[start:stop]], flows)
+            total = np.bincount(parentOf, flows, len(parents))
+            available = residual[parents]
+            over = total > available
+            if over.any():
+                if not globals.printed_lowering_delta_t_message:
+                    print('******Please consider lowering delta_t.******')
+                    globals.printed_lowering_delta_t_message = True
+                factor = np.where(over, available / np.where(over, total, 1), 1)
+                flows = flows * factor[parentOf]
+            #A child takes what fits, its parents served in order
+            room = volume[children] - residual[children]
+            sortedFlows = flows[r['byChild']]
+            before = np.cumsum(sortedFlows) - sortedFlows
+            before -= np.repeat(before[r['groupStart']], r['groupSize'])
+            taken = np.empty(stop - start)
+            taken[r['byChild']] = np.clip(room[childOf[r['byChild']]] - before, 0, sortedFlows)
+            received = np.bincount(childOf, taken, len(children))
+            residual[children] += received
+            lastFlow[children] += received
+            out = np.bincount(parentOf, taken, len(parents))
+            self.outflow[parents] = out
+            residual[parents] = np.maximum(available - out, 0)
+
+        #Organs drain what came in delay steps after it did
+        delay = self.__drainDelay()
+        if len(delay) > 0 and delay.max() >= len(self.drains):
+            size = 2 * int(delay.max()) + 1
+            drains = np.zeros((size, len(self.organs)))
+            for k in range(len(self.drains)):
+                drains[(globals.time + k) % size] = self.drains[(globals.time + k) % len(self.drains)]
+            self.drains = drains
+        columns = np.arange(len(self.organs))
+        self.drains[(globals.time + delay) % len(self.drains), columns] += lastFlow[self.organs]
+        due = self.drains[globals.time % len(self.drains)]
+        residual[self.organs] = np.maximum(residual[self.organs] - due, 0)
+        due[:] = 0
+        return actual
+
+    #Copy residual volumes and last inflows back onto the hosts, where drawing
+    #and reporting read them as after a step down the vessel tree
+    def writeBack(self):
+        residuals = self.residualVolume.tolist()
+        flows = self.lastFlow.tolist()
+        for (i, vessel) in enumerate(self.hosts[:self.vesselCount]):
+            vessel.residualVolume = residuals[i]
+            vessel.lastFlow = flows[i]
+        for i in self.organs.tolist():
+            self.hosts[i].residualVolume = residuals[i]
+
+    #Append the last inflow of every host to its flow history, every
+    #flow_history_interval time intervals
+    def recordFlowHistory(self):
+        if globals.time % parameters.flow_history_interval == 0:
+            for (host, flow) in zip(self.hosts, self.lastFlow.tolist()):
+                host.flowHistory.append(flow)
+
+    def getVessels(self):
+        return self.hosts[:self.vesselCount]
+
+    def getSinks(self):
+        return self.hosts[self.vesselCount:]
+
+    #Flow that left vessel this step, for moving its cells along
+    def getOutflow(self, vessel):
+        return self.outflow[self.index[id(vessel)]]
+
+    def getResidualVolume(self, host):
+        return self.residualVolume[self.index[id(host)]]
+
+    #Flow into host this step, 0 for a host the heart does not feed
+    def getLastFlow(self, host):
+        i = self.index.get(id(host))
+        return 0 if i is None else self.lastFlow[i]
@@ -5,5 +5,6 @@ globals = Global()
 globals.time = 0
 globals.terminalOutputEvent = []
 globals.objects = None
+globals.network = None
 globals.printed_lowering_delta_t_message = False
 globals.payload = {'data': {'bloodFlow': {}, 'bacteriaCount': {}}};
\ No newline at end of file
@@ -28,6 +28,7 @@ E9EA00,E9EE00,E9F200,E8F600,E8FA00,E8FF00"
 parameters.cell_count_color_mapping = 1e8
 parameters.cell_count_history_interval = 1 #collect cell count every x time intervals
 parameters.flow_history_interval = 1
+parameters.live_step_interval = 1 #s of wall clock between steps in the live viewer
 
 #Simulation parameters
 parameters.blood_density = 1.05e3 #kg/m^3
@@ -50,8 +51,20 @@ parameters.organ_grid_resolution = 1e-3 #m
 
 #Time parameters
 parameters.delta_t = 0.5#s
+#How blood moves each step. 'recursive' walks Node.timeStep down the vessel
+#tree and steps a vessel with several parents once per parent; its lastFlow is
+#then what that one parent just sent. 'vectorized' (VesselNetwork.py) steps
+#every vessel once, and its lastFlow is the total its parents sent this step.
+#A link whose pressure drop gives no flow falls back to its parent's lastFlow,
+#so for a multi-parent vessel that fallback differs between the modes. In both,
+#a vessel that received nothing this step falls back to 0, not to its flow of
+#the step before. On a tree the modes agree to rounding (test_hemodynamics.py).
+#On the body they differ at the multi-parent vessels, and from there the
+#random cluster moves diverge too.
+parameters.hemodynamics = 'vectorized' #'vectorized' (VesselNetwork.py) or 'recursive', Node.timeStep down the vessel tree
 parameters.bacteria_lifespan = 36000 #s
 parameters.bacteria_reproduction_rate = 5e-5 #1/s
+parameters.batch_record_interval = 100 #time intervals between samples of a headless run
 
 #initial bacteria infestation
 parameters.bacteria_t0 = {
@@ -0,0 +1,189 @@
+from parameters import *
+from oscillator import *
+import initialize
+import Node
+from VesselNetwork import VesselNetwork
+from globals import *
+from AbstractBacteriaCellCluster import *
+from AbstractImmuneCellCluster import *
+from AbstractHost import *
+from heapq import heappush, heappop
+import argparse
+import time as t
+import numpy as np
+
+#The simulation loop, with no server, browser or wall clock attached.
+#step() advances the body by one time interval (delta_t seconds of simulated
+#time) as fast as it can; the live viewer in main.py paces the steps itself.
+#Run this file for a headless batch run that writes its results at the end.
+
+#dfs
+def timestep(o):
+    assert(o is not None)
+    assert(isinstance(o, AbstractHost))
+    children = o.getChildren()
+    o.timeStep()
+    if children is not None:
+        for child in children:
+            timestep(child)
+
+#Build the body and put in the initial bacteria and immune cell clusters
+def setup():
+    blood_vessels = initialize.processInput(parameters.blood_vessel_file)
+    organs = initialize.processInput(parameters.organ_file)
+    objects = initialize.buildGraph(blood_vessels, organs)
+    setNetwork(objects)
+
+    #insert bacteria clusters
+    for id, cluster in parameters.bacteria_t0.items():
+        id = int(id)
+        assert(isinstance(cluster, AbstractBacteriaCellCluster))
+        objects[id].enterBacteriaCluster(cluster)
+
+    for id, cluster in parameters.immune_t0.items():
+        id = int(id)
+        assert(isinstance(cluster, AbstractImmuneCellCluster))
+        objects[id].enterImmuneCellCluster(cluster)
+
+    globals.objects = objects
+    return objects
+
+#Flatten the vessels fed from the ascending aorta for the vectorized
+#hemodynamics
+def setNetwork(objects):
+    globals.network = VesselNetwork(objects[0])
+    return globals.network
+
+#One time interval: clusters back from the veins enter the heart, the heart
+#pumps and every host takes its time step
+def step(objects):
+    assert(objects[0].id == 1)
+    head = objects[0]
+    initialVelocity = oscillator.getVelocity()
+    #Get bacteria,
+    while len(globals.terminalOutputEvent) > 0 and globals.terminalOutputEvent[0][0] <= globals.time:
+        (time, cluster) = heappop(globals.terminalOutputEvent)
+        assert(isinstance(cluster, AbstractCellCluster))
+        if isinstance(cluster, AbstractBacteriaCellCluster):
+            head.enterBacteriaCluster(cluster)
+        elif isinstance(cluster, AbstractImmuneCellCluster):
+            head.enterImmuneCellCluster(cluster)
+    flow = oscillator.getVolume()
+    if parameters.hemodynamics == 'recursive':
+        actualFlow = head.setFlow(flow)
+        oscillator.setlastVolume(actualFlow)
+        head._velocity = initialVelocity
+        timestep(head)
+    elif parameters.hemodynamics == 'vectorized':
+        network = globals.network
+        actualFlow = network.timeStep(flow, initialVelocity)
+        oscillator.setlastVolume(actualFlow)
+        network.writeBack()
+        moveCells(network)
+    else:
+        raise Exception('Unknown hemodynamics: ' + str(parameters.hemodynamics))
+
+    if parameters.verbose:
+        for id, cluster in parameters.bacteria_t0.items():
+            if cluster.host is None:
+                print("cluster id", id, "not in host")
+            else:
+                print("cluster id ", id, "in", cluster.host.id)
+
+    globals.time += 1
+
+#The cell part of every host's time step once the network moved the blood:
+#vessels in topological order pass their cells on, so cells can travel as far
+#in a step as they did down the vessel tree, then organs and sinks step
+def moveCells(network):
+    recordCounts = globals.time % parameters.cell_count_history_interval == 0
+    for vessel in network.getVessels():
+        if recordCounts:
+            vessel.bacteriaCountHistory.append(vessel.getBacteriaCount())
+        if vessel.bacteriaClusters or vessel.immuneCellClusters:
+            vessel.moveClusters(vessel.getChildren(), network.getOutflow(vessel))
+    network.recordFlowHistory()
+    for sink in network.getSinks():
+        sink.timeStep()
+
+#Bring the live viewer's payload up to date; walking the vessel tree, the
+#vessels fill it in themselves
+def fillPayload(objects):
+    if parameters.hemodynamics != 'vectorized':
+        return
+    data = globals.payload['data']
+    for node in objects:
+        data['bloodFlow'][node.id] = float(node.lastFlow)
+        data['bacteriaCount'][node.id] = node.getBacteriaCount()
+
+#Every blood vessel and organ once, vessels first
+def getHosts(objects):
+    hosts = list(objects)
+    for node in objects:
+        for sink in node.getChildren():
+            if not isinstance(sink, Node.Node) and sink not in hosts:
+                hosts.append(sink)
+    return hosts
+
+#Run steps time intervals, sampling the bacteria count of every host and the
+#blood flow into every vessel every interval steps. Returns the samples.
+#With historyInterval the hosts' own count and flow histories, kept for the
+#live plots, are appended only every historyInterval steps during the run.
+def run(objects, steps, interval=None, historyInterval=None):
+    if interval is None:
+        interval = parameters.batch_record_interval
+    saved = (parameters.cell_count_history_interval, parameters.flow_history_interval)
+    if historyInterval is not None:
+        parameters.cell_count_history_interval = historyInterval
+        parameters.flow_history_interval = historyInterval
+    try:
+        return record(objects, steps, interval)
+    finally:
+        (parameters.cell_count_history_interval, parameters.flow_history_interval) = saved
+
+#The sampling loop of run
+def record(objects, steps, interval):
+    hosts = getHosts(objects)
+    samples = (steps + interval - 1) // interval
+    times = np.zeros(samples, dtype=np.int64)
+    bacteriaCount = np.zeros((samples, len(hosts)))
+    bloodFlow = np.zeros((samples, len(objects)))
+    sample = 0
+    for i in range(steps):
+        step(objects)
+        if i % interval == interval - 1 or i == steps - 1:
+            times[sample] = globals.time
+            bacteriaCount[sample] = [host.getBacteriaCount() for host in hosts]
+            bloodFlow[sample] = [node.lastFlow for node in objects]
+            sample += 1
+    return {'time': times[:sample], 'seconds': times[:sample] * parameters.delta_t, \
+        'ids': np.array([host.id for host in hosts]), 'names': np.array([host.name for host in hosts]), \
+        'vesselIds': np.array([node.id for node in objects]), \
+        'bacteriaCount': bacteriaCount[:sample], 'bloodFlow': bloodFlow[:sample]}
+
+def writeResults(results, fileName):
+    np.savez_compressed(fileName, **results)
+    return fileName
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Headless batch run of the bacteria body simulation')
+    parser.add_argument('--seconds', type=float, default=None, help='simulated seconds to run, bacteria_lifespan by default')
+    parser.add_argument('--steps', type=int, default=None, help='time intervals to run, instead of --seconds')
+    parser.add_argument('--interval', type=int, default=None, help='time intervals between samples')
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+    if args.steps is not None:
+        steps = args.steps
+    else:
+        seconds = args.seconds if args.seconds is not None else parameters.bacteria_lifespan
+        steps = int(round(seconds / parameters.delta_t))
+    interval = args.interval if args.interval is not None else parameters.batch_record_interval
+    start = t.time()
+    objects = setup()
+    built = t.time()
+    #In batch mode the host plot histories are sampled only every interval steps
+    results = run(objects, steps, interval, historyInterval=interval)
+    fileName = args.output if args.output is not None else "data/Batch" + str(t.time()) + ".npz"
+    writeResults(results, fileName)
+    print("Ran " + str(steps) + " steps (" + str(steps * parameters.delta_t) + " s) in " + "{:.1f}".format(t.time() - built) \
+        + " s after " + "{:.1f}".format(built - start) + " s of setup, wrote " + fileName)
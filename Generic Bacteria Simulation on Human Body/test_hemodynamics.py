@@ -0,0 +1,51 @@
+import copy
+import numpy as np
+import initialize
+import simulation
+from oscillator import oscillator
+from parameters import parameters
+from globals import globals
+
+#The body with every vessel and organ kept under its first parent only
+def treeRows():
+    blood_vessels = initialize.processInput(parameters.blood_vessel_file)
+    organs = initialize.processInput(parameters.organ_file)
+    fed = set()
+    for row in blood_vessels:
+        children = [j for j in row[8].split(',') if int(j) > 0 and int(j) not in fed]
+        fed.update(int(j) for j in children)
+        row[8] = ','.join(children) if children else '0'
+    for row in organs:
+        row[4] = row[4].split(',')[0]
+    return (blood_vessels, organs)
+
+#Last inflow and residual volume of every vessel and organ after each step,
+#over their volumes
+def runMode(mode, rows, steps):
+    parameters.hemodynamics = mode
+    globals.time = 0
+    oscillator.residualVolume = parameters.stroke_volume
+    objects = initialize.buildGraph(*copy.deepcopy(rows))
+    network = simulation.setNetwork(objects)
+    hosts = [host for host in network.hosts if hasattr(host, 'residualVolume')]
+    volumes = np.array([host.volume for host in hosts])
+    states = []
+    for i in range(steps):
+        simulation.step(objects)
+        states.append([getattr(host, 'lastFlow', 0) / volume for (host, volume) in zip(hosts, volumes)] \
+            + [host.residualVolume / volume for (host, volume) in zip(hosts, volumes)])
+    return np.array(states)
+
+#With a single parent per vessel the vectorized network moves blood exactly as
+#the walk down the vessel tree does
+def test_modes_agree_on_a_tree(monkeypatch):
+    monkeypatch.setattr(parameters, 'organ_grid_resolution', 1e-2)
+    monkeypatch.setattr(parameters, 'bacteria_t0', {})
+    monkeypatch.setattr(parameters, 'immune_t0', {})
+    monkeypatch.setattr(parameters, 'hemodynamics', parameters.hemodynamics)
+    monkeypatch.setattr(parameters, 'verbose', False)
+    rows = treeRows()
+    recursive = runMode('recursive', rows, 200)
+    vectorized = runMode('vectorized', rows, 200)
+    assert np.abs(recursive).max() > 0
+    assert np.abs(recursive - vectorized).max() < 1e-12